@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger("apscheduler")
+
+
+def claim_fields(prefix: str) -> Tuple[str, str]:
+    """
+    Names of the claim token and lease deadline fields for a destination.
+    """
+    return f"{prefix}ClaimToken", f"{prefix}ClaimUntil"
+
+
+async def claim_batch(
+        collection, prefix: str, query: dict,
+        batch_size: int, lease_seconds: float,
+        projection: Optional[dict] = None) -> Tuple[str, List[dict]]:
+    """
+    Atomically claim up to `batch_size` documents matching `query` that are
+    not claimed or whose claim expired. Returns the claim token and the
+    documents this worker won. An empty list means nothing is left to claim.
+    """
+    token_field, until_field = claim_fields(prefix)
+    while True:
+        now = datetime.now(timezone.utc)
+        claimable = {
+            **query,
+            "$or": [
+                {until_field: {"$exists": False}},
+                {until_field: {"$lt": now}}
+            ]
+        }
+        candidates = await collection.find(claimable, {"_id": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(None)
+        if not candidates:
+            return None, []
+
+        token = uuid.uuid4().hex
+        # Re-check the claimable condition per document so only one worker
+        # wins each record
+        await collection.update_many(
+            {**claimable, "_id": {"$in": [doc["_id"] for doc in candidates]}},
+            {"$set": {
+                token_field: token,
+                until_field: now + timedelta(seconds=lease_seconds)
+            }}
+        )
+        claimed = await collection.find({token_field: token}, projection) \
+            .to_list(None)
+        if claimed:
+            return token, claimed
+        # Another worker won every candidate. They are no longer
+        # claimable, so the next read moves on to the following ones
+
+
+async def complete_claim(collection, prefix: str, token: str, sent_field: str):
+    """
+    Mark the claimed documents as sent and drop the claim.
+    """
+    token_field, until_field = claim_fields(prefix)
+    await collection.update_many(
+        {token_field: token},
+        {
+            "$set": {sent_field: True},
+            "$unset": {token_field: "", until_field: ""}
+        }
+    )
+
+
+async def release_claim(collection, prefix: str, token: str):
+    """
+    Drop a claim so the documents can be picked up again right away.
+    """
+    token_field, until_field = claim_fields(prefix)
+    await collection.update_many(
+        {token_field: token},
+        {"$unset": {token_field: "", until_field: ""}}
+    )
+
+
+async def drain_with_claims(
+        name: str, collection, prefix: str, sent_field: str, query: dict,
+        send: Callable[[List[dict]], Awaitable[bool]],
+        batch_size: int, lease_seconds: float, workers: int,
+        projection: Optional[dict] = None) -> int:
+    """
+    Drain the backlog with `workers` concurrent claim-send-complete loops.
+    Each loop stops when nothing is left to claim or a send fails.
+    Returns the number of records sent by this process.
+    """
+    async def worker() -> int:
+        sent = 0
+        while True:
+            token, batch = await claim_batch(
+                collection, prefix, query,
+                batch_size, lease_seconds, projection
+            )
+            if not batch:
+                return sent
+            if not await send(batch):
+                await release_claim(collection, prefix, token)
+                logger.error(f"[{name}] Claimed batch failed. "
+                             f"Records released: {len(batch)}")
+                return sent
+            await complete_claim(collection, prefix, token, sent_field)
+            sent += len(batch)
+
+    results = await asyncio.gather(
+        *[worker() for _ in range(workers)], return_exceptions=True
+    )
+    sent = 0
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"[{name}] Claim worker error: {result}")
+        else:
+            sent += result
+    logger.info(f"[{name}] Claimed batches sent. Records updated: {sent}")
+    return sent
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("apscheduler")
+
+
+class DispatchTrigger:
+    """
+    Run a dispatch job as soon as `batch_size` ingested records are pending,
+    or `max_latency` seconds after the first pending record, whichever comes
+    first. Ingest reports new records with `signal`.
+
+    Runs of the job never overlap, whether triggered or started by the cron
+    sweep through `run_once`.
+    """
+
+    def __init__(self, name: str, job: Callable[[], Awaitable[None]],
+                 batch_size: int = 500, max_latency: float = 2):
+        self.name = name
+        self.job = job
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._pending = 0
+        self._deadline: Optional[float] = None
+        self._event: Optional[asyncio.Event] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._event = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def signal(self, count: int):
+        """
+        Report `count` newly ingested records. Never blocks.
+        """
+        if self._task is None or count <= 0:
+            return
+        self._pending += count
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.max_latency
+            self._event.set()
+        elif self._pending >= self.batch_size:
+            self._event.set()
+
+    async def run_once(self):
+        """
+        Run the job, waiting for a run in progress to finish first.
+        """
+        async with self._lock:
+            await self.job()
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            timeout = self._deadline - time.monotonic() \
+                if self._deadline is not None else 0
+            if self._pending < self.batch_size and timeout > 0:
+                # Wake up early only when the batch size is reached
+                try:
+                    await asyncio.wait_for(self._event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._event.clear()
+            if not self._pending:
+                continue
+
+            reason = "size" if self._pending >= self.batch_size \
+                else "deadline"
+            logger.info(f"[TRIGGER {self.name}] Dispatching after "
+                        f"{self._pending} new records ({reason}).")
+            self._pending = 0
+            self._deadline = None
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"[TRIGGER {self.name}] Dispatch error: {e}")
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import (
+    AsyncIterable, Awaitable, Callable, Iterable, Iterator, Tuple, Union
+)
+
+logger = logging.getLogger("apscheduler")
+
+
+def split_chunks(records: list, chunk_size: int) -> Iterator[list]:
+    for start in range(0, len(records), chunk_size):
+        yield records[start:start + chunk_size]
+
+
+async def _iterate(chunks: Union[Iterable[list], AsyncIterable[list]]):
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+
+async def fan_out_chunks(
+        name: str,
+        chunks: Union[Iterable[list], AsyncIterable[list]],
+        send: Callable[[list], Awaitable[bool]],
+        max_in_flight: int) -> Tuple[int, int]:
+    """
+    Send chunks concurrently, at most `max_in_flight` at a time. `send`
+    posts one chunk and marks it as sent when it is acknowledged.
+    No new chunk is started after a failure, so the rest is left for the
+    next run. Returns the number of records acknowledged and failed.
+    """
+    in_flight = {}
+    acknowledged = failed = 0
+    stopped = False
+
+    def collect(done):
+        nonlocal acknowledged, failed, stopped
+        for task in done:
+            size = in_flight.pop(task)
+            try:
+                success = task.result()
+            except Exception as e:
+                logger.error(f"[{name}] Error sending chunk of "
+                             f"{size} records: {e}")
+                success = False
+            if success:
+                acknowledged += size
+            else:
+                failed += size
+                stopped = True
+
+    async for chunk in _iterate(chunks):
+        if not chunk:
+            continue
+        in_flight[asyncio.create_task(send(chunk))] = len(chunk)
+        if len(in_flight) >= max_in_flight:
+            done, _ = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+            collect(done)
+        if stopped:
+            break
+
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        collect(done)
+    if failed:
+        logger.error(f"[{name}] Chunks failed. Stopping this run. "
+                     f"Records sent: {acknowledged}, failed: {failed}")
+    return acknowledged, failed
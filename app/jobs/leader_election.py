@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger("apscheduler")
+
+
+class LeaderLease:
+    """
+    Lease-based leader election backed by a MongoDB document.
+
+    The holder renews the lease every `heartbeat` seconds. When it stops
+    renewing, any other process takes the lease once `ttl` seconds passed.
+    """
+
+    def __init__(self, collection, name: str,
+                 ttl: float = 15, heartbeat: float = 5):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.holder_id = f"{socket.gethostname()}-{os.getpid()}-" \
+                         f"{uuid.uuid4().hex[:8]}"
+        self._expires_at = None
+        self._task = None
+
+    def is_leader(self) -> bool:
+        return (self._expires_at is not None and
+                datetime.now(timezone.utc) < self._expires_at)
+
+    async def try_acquire(self) -> bool:
+        """
+        Take or renew the lease. Returns True when this process holds it.
+        """
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl)
+        was_leader = self.is_leader()
+        try:
+            await self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"holder": self.holder_id},
+                        {"expiresAt": {"$lt": now}}
+                    ]
+                },
+                {"$set": {
+                    "holder": self.holder_id,
+                    "expiresAt": expires_at,
+                    "renewedAt": now
+                }},
+                upsert=True
+            )
+            self._expires_at = expires_at
+            if not was_leader:
+                logger.info(f"[LEADER {self.name}] Lease acquired by "
+                            f"{self.holder_id}.")
+            return True
+        except DuplicateKeyError:
+            # Another process holds a valid lease
+            if was_leader:
+                logger.warning(f"[LEADER {self.name}] Lease lost by "
+                               f"{self.holder_id}.")
+            self._expires_at = None
+            return False
+        except Exception as e:
+            logger.error(f"[LEADER {self.name}] Error renewing lease: {e}")
+            return self.is_leader()
+
+    async def release(self):
+        """
+        Give up the lease so another process can take over right away.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._expires_at is None:
+            return
+        self._expires_at = None
+        try:
+            await self.collection.delete_one(
+                {"_id": self.name, "holder": self.holder_id}
+            )
+            logger.info(f"[LEADER {self.name}] Lease released by "
+                        f"{self.holder_id}.")
+        except Exception as e:
+            logger.error(f"[LEADER {self.name}] Error releasing lease: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.try_acquire()
+            await asyncio.sleep(self.heartbeat)
@@ -0,0 +1,67 @@
+"""
+One-off migration: add BSON datetime `timeAt` fields next to the existing
+ISO `time` strings and drop the indexes built on the strings.
+
+Run once after deploying:
+    python -m app.jobs.migrate_time_fields
+"""
+from app.utils.database import (
+    gps_collection,
+    gps_payload_collection,
+    gps_history_collection,
+    alarms_payload_collection,
+    setup_indexes,
+    OBSOLETE_INDEXES
+)
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+import app.utils.logging_config as logging_config  # noqa: F401
+
+logger = logging.getLogger("apscheduler")
+
+COLLECTIONS = [
+    gps_collection,
+    gps_payload_collection,
+    gps_history_collection,
+    alarms_payload_collection,
+]
+
+
+async def migrate_collection(collection) -> int:
+    """
+    Parse `time` into `timeAt` on the server for documents missing it.
+    """
+    result = await collection.update_many(
+        {"timeAt": {"$exists": False}, "time": {"$type": "string"}},
+        [{"$set": {"timeAt": {"$dateFromString": {
+            "dateString": "$time",
+            "onError": None,
+            "onNull": None
+        }}}}]
+    )
+    logger.info(f"[MIGRATION] {collection.name}: "
+                f"{result.modified_count} documents updated.")
+    return result.modified_count
+
+
+async def drop_obsolete_indexes():
+    for collection, name in OBSOLETE_INDEXES:
+        try:
+            await collection.drop_index(name)
+            logger.info(f"[MIGRATION] Dropped index {name} "
+                        f"on {collection.name}.")
+        except OperationFailure:
+            # Index not found
+            pass
+
+
+async def main():
+    for collection in COLLECTIONS:
+        await migrate_collection(collection)
+    await drop_obsolete_indexes()
+    await setup_indexes()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
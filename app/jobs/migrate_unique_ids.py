@@ -0,0 +1,61 @@
+"""
+One-off migration: remove positions stored more than once with the same
+`id`, keeping the first one, so the unique `id` indexes can be built.
+
+Run once after deploying:
+    python -m app.jobs.migrate_unique_ids
+"""
+from app.utils.database import (
+    gps_collection,
+    gps_history_collection,
+    setup_indexes
+)
+import asyncio
+import logging
+import app.utils.logging_config as logging_config  # noqa: F401
+
+logger = logging.getLogger("apscheduler")
+
+COLLECTIONS = [
+    gps_collection,
+    gps_history_collection,
+]
+DELETE_BATCH_SIZE = 1000
+
+
+async def remove_duplicates(collection) -> int:
+    """
+    Delete every document but the oldest one of each repeated `id`.
+    """
+    cursor = collection.aggregate([
+        {"$group": {
+            "_id": "$id",
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    removed = 0
+    pending = []
+    async for group in cursor:
+        pending.extend(sorted(group["ids"])[1:])
+        if len(pending) >= DELETE_BATCH_SIZE:
+            result = await collection.delete_many({"_id": {"$in": pending}})
+            removed += result.deleted_count
+            pending = []
+    if pending:
+        result = await collection.delete_many({"_id": {"$in": pending}})
+        removed += result.deleted_count
+    logger.info(f"[MIGRATION] {collection.name}: "
+                f"{removed} duplicate documents removed.")
+    return removed
+
+
+async def main():
+    for collection in COLLECTIONS:
+        await remove_duplicates(collection)
+    await setup_indexes()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,180 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from app.services.migtra_service import send_gps_data_to_migtra
-from app.services.gauss_service import send_gps_data_to_gauss_control
-from app.utils.database import gps_collection
+from app.services.migtra_service import (
+    send_gps_data_to_migtra_or_retry,
+    MIGTRA_MAX_CONCURRENCY
+)
+from app.services.gauss_service import (
+    send_gps_data_to_gauss_control,
+    GAUSS_MAX_CONCURRENCY
+)
+from app.services.gps_service import (
+    latest_positions,
+    ingest_listeners,
+    LOG_GPS_DATA
+)
+from app.jobs.leader_election import LeaderLease
+from app.jobs.dispatch_trigger import DispatchTrigger
+from app.jobs.claim_dispatch import drain_with_claims
+from app.jobs.fanout_dispatch import fan_out_chunks, split_chunks
+from app.jobs.timeseries_dispatch import (
+    send_migtra_from_timeseries,
+    send_gauss_from_timeseries
+)
+from app.utils.database import (
+    gps_collection,
+    gauss_sent_positions_collection,
+    scheduler_leases_collection,
+    GPS_STORAGE_BACKEND
+)
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta, timezone
+import asyncio
+import functools
 import logging
+import os
 
 logger = logging.getLogger("apscheduler")
 
+# "all" loads the whole backlog at once, "chunked" streams it in pages,
+# "claim" lets several workers drain it in parallel with atomic claims
+MIGTRA_DISPATCH_MODE = os.getenv("MIGTRA_DISPATCH_MODE", "all").lower()
+MIGTRA_CURSOR_BATCH_SIZE = int(os.getenv("MIGTRA_CURSOR_BATCH_SIZE", "1000"))
+MIGTRA_CHUNK_SIZE = int(os.getenv("MIGTRA_CHUNK_SIZE", "500"))
+# "database" aggregates gps_data, "memory" reads the latest position table
+GAUSS_POSITIONS_SOURCE = \
+    os.getenv("GAUSS_POSITIONS_SOURCE", "database").lower()
+# "aggregate" reduces the window in one query, "claim" uses atomic claims
+GAUSS_DISPATCH_MODE = os.getenv("GAUSS_DISPATCH_MODE", "aggregate").lower()
+# Latest positions per request to Gauss, chunks are posted concurrently
+GAUSS_CHUNK_SIZE = int(os.getenv("GAUSS_CHUNK_SIZE", "500"))
+
+# Claim mode: concurrent loops per process, records per claim, claim lease
+DISPATCH_CLAIM_WORKERS = int(os.getenv("DISPATCH_CLAIM_WORKERS", "2"))
+DISPATCH_CLAIM_BATCH_SIZE = int(os.getenv("DISPATCH_CLAIM_BATCH_SIZE", "500"))
+DISPATCH_CLAIM_LEASE_SECONDS = \
+    float(os.getenv("DISPATCH_CLAIM_LEASE_SECONDS", "120"))
+
+# Only the lease holder runs the jobs when several processes are started
+SCHEDULER_LEADER_ELECTION = \
+    os.getenv("SCHEDULER_LEADER_ELECTION", "true").lower() == 'true'
+SCHEDULER_LEASE_TTL_SECONDS = \
+    float(os.getenv("SCHEDULER_LEASE_TTL_SECONDS", "15"))
+SCHEDULER_LEASE_HEARTBEAT_SECONDS = \
+    float(os.getenv("SCHEDULER_LEASE_HEARTBEAT_SECONDS", "5"))
+
+# The latest position table only holds what this process ingested, so with
+# several processes the leader would send only its own vehicles
+if GAUSS_POSITIONS_SOURCE == "memory" and SCHEDULER_LEADER_ELECTION:
+    logger.warning("[SCHEDULER] GAUSS_POSITIONS_SOURCE=memory needs a single "
+                   "process and leader election is enabled. Using the "
+                   "database source. Set SCHEDULER_LEADER_ELECTION=false "
+                   "to use memory.")
+    GAUSS_POSITIONS_SOURCE = "database"
+
+# "cron" dispatches on the schedule only. "event" also dispatches when
+# enough positions are ingested or the oldest one waited long enough,
+# keeping the cron as a safety sweep
+DISPATCH_TRIGGER_MODE = os.getenv("DISPATCH_TRIGGER_MODE", "cron").lower()
+DISPATCH_TRIGGER_BATCH_SIZE = \
+    int(os.getenv("DISPATCH_TRIGGER_BATCH_SIZE", "500"))
+DISPATCH_TRIGGER_MAX_LATENCY_MS = \
+    float(os.getenv("DISPATCH_TRIGGER_MAX_LATENCY_MS", "2000"))
+
+scheduler_lease = LeaderLease(
+    scheduler_leases_collection, "scheduler",
+    SCHEDULER_LEASE_TTL_SECONDS, SCHEDULER_LEASE_HEARTBEAT_SECONDS
+)
+
+
+def leader_only(job):
+    """
+    Run the job only in the process holding the scheduler lease.
+    """
+    @functools.wraps(job)
+    async def wrapper():
+        if SCHEDULER_LEADER_ELECTION and not scheduler_lease.is_leader():
+            logger.debug("[SCHEDULER] Not the leader. "
+                         f"Skipping {job.__name__}.")
+            return
+        await job()
+    return wrapper
+
+
+MIGTRA_PROJECTION = {
+    "id": 1, "vehicleNumber": 1, "time": 1, "receivedAt": 1,
+    "lat": 1, "lng": 1, "altitude": 1, "speed": 1,
+    "angle": 1, "hdop": 1, "acc": 1
+}
+
+
+async def send_migtra_chunk(chunk: list) -> bool:
+    """
+    Send one chunk to Migtra and mark only its records as sent.
+    """
+    success = await send_gps_data_to_migtra_or_retry(chunk)
+    if success:
+        await gps_collection.update_many(
+            {"_id": {"$in": [record["_id"] for record in chunk]}},
+            {"$set": {"sentToMigtra": True}}
+        )
+    return success
+
+
+async def cursor_chunks(cursor, chunk_size: int):
+    """
+    Group the records of a cursor in chunks of `chunk_size`.
+    """
+    chunk = []
+    async for record in cursor:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def process_and_send_migtra_chunked():
+    """
+    Stream the unsent backlog from a cursor and send it in fixed-size chunks,
+    several at a time. Only the chunks in flight are held in memory. Stops
+    at the first failed chunk so the rest is retried on the next run.
+    """
+    cursor = gps_collection.find(
+        {"sentToMigtra": False}, MIGTRA_PROJECTION
+    ).sort("_id", 1).batch_size(MIGTRA_CURSOR_BATCH_SIZE)
+
+    try:
+        sent, _ = await fan_out_chunks(
+            "MIGTRA", cursor_chunks(cursor, MIGTRA_CHUNK_SIZE),
+            send_migtra_chunk, MIGTRA_MAX_CONCURRENCY
+        )
+    finally:
+        await cursor.close()
+
+    logger.info(f"[MIGTRA] GPS data sent to Migtra in chunks. "
+                f"Records updated: {sent}")
+
 
 async def process_and_send_migtra():
     """Process and send data to Migtra."""
+    if GPS_STORAGE_BACKEND == "timeseries":
+        await send_migtra_from_timeseries(MIGTRA_CHUNK_SIZE)
+        return
+    if MIGTRA_DISPATCH_MODE == "chunked":
+        await process_and_send_migtra_chunked()
+        return
+    if MIGTRA_DISPATCH_MODE == "claim":
+        await drain_with_claims(
+            "MIGTRA", gps_collection, "migtra", "sentToMigtra",
+            {"sentToMigtra": False},
+            send_gps_data_to_migtra_or_retry,
+            DISPATCH_CLAIM_BATCH_SIZE, DISPATCH_CLAIM_LEASE_SECONDS,
+            DISPATCH_CLAIM_WORKERS, MIGTRA_PROJECTION
+        )
+        return
+
     gps_data = await gps_collection.find({
         "sentToMigtra": False
     }).to_list(None)
@@ -18,71 +182,220 @@ async def process_and_send_migtra():
                 f"Total payloads: {len(gps_data)}")
 
     if gps_data:
-        success = await send_gps_data_to_migtra(gps_data)
-        if success:
-            gps_ids = [record["_id"] for record in gps_data]
-            await gps_collection.update_many(
-                {"_id": {"$in": gps_ids}},
-                {"$set": {"sentToMigtra": True}}
-            )
-            logger.info("[MIGTRA] GPS data sent to Migtra. Records updated.")
+        sent, _ = await fan_out_chunks(
+            "MIGTRA", split_chunks(gps_data, MIGTRA_CHUNK_SIZE),
+            send_migtra_chunk, MIGTRA_MAX_CONCURRENCY
+        )
+        logger.info("[MIGTRA] GPS data sent to Migtra. "
+                    f"Records updated: {sent}")
+
+
+async def mark_gauss_vehicles_sent(records: list, window_start: datetime):
+    """
+    Mark the window records of each vehicle in `records` as sent, up to the
+    position sent for that vehicle. Later rows stay unsent.
+    """
+    await gps_collection.update_many(
+        {
+            "sentToGaussControl": False,
+            "$or": [
+                {
+                    "vehicleNumber": record["vehicleNumber"],
+                    "timeAt": {"$gte": window_start, "$lte": record["timeAt"]}
+                }
+                for record in records
+            ]
+        },
+        {"$set": {"sentToGaussControl": True}}
+    )
+
+
+async def send_latest_positions_to_gauss(window_start: datetime):
+    """
+    Send the pending positions of the in-memory latest position table.
+    """
+    pending = [
+        position for position in latest_positions.values()
+        if position.pendingGauss and position.timeAt >= window_start
+    ]
+    if not pending:
+        logger.info("[GAUSS] No GPS data to process.")
+        return
+
+    logger.info("[GAUSS] Latest positions to send. "
+                f"Unique vehicles: {len(pending)}")
+
+    async def send_chunk(chunk: list) -> bool:
+        records = [position.to_dict() for position in chunk]
+        if not await send_gps_data_to_gauss_control(records):
+            return False
+        for position in chunk:
+            position.pendingGauss = False
+        if LOG_GPS_DATA:
+            await mark_gauss_vehicles_sent(records, window_start)
+        return True
+
+    sent, _ = await fan_out_chunks(
+        "GAUSS", split_chunks(pending, GAUSS_CHUNK_SIZE),
+        send_chunk, GAUSS_MAX_CONCURRENCY
+    )
+    logger.info(f"[GAUSS] GPS data sent to Gauss Control. Vehicles: {sent}")
+
+
+async def reserve_gauss_position(record: dict) -> bool:
+    """
+    Record `record` as the newest position sent for its vehicle, unless a
+    newer one was already reserved. Returns False for a stale position.
+    """
+    try:
+        await gauss_sent_positions_collection.update_one(
+            {
+                "_id": record["vehicleNumber"],
+                "timeAt": {"$lte": record["timeAt"]}
+            },
+            {"$set": {"timeAt": record["timeAt"]}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The vehicle exists with a newer position
+        return False
+
+
+async def send_latest_of_batch_to_gauss(batch: list) -> bool:
+    """
+    Send only the latest position per vehicle of a claimed batch.
+    Batches are sent by concurrent workers, so positions older than the
+    last one reserved for their vehicle are dropped instead of moving the
+    vehicle backwards in Gauss.
+    """
+    latest = {}
+    for record in batch:
+        current = latest.get(record["vehicleNumber"])
+        if current is None or record["timeAt"] > current["timeAt"]:
+            latest[record["vehicleNumber"]] = record
+    reserved = await asyncio.gather(
+        *[reserve_gauss_position(record) for record in latest.values()]
+    )
+    fresh = [
+        record for record, kept in zip(latest.values(), reserved) if kept
+    ]
+    if not fresh:
+        return True
+    return await send_gps_data_to_gauss_control(fresh)
 
 
 async def process_and_send_gauss_control():
     """
     Process and send data to Gauss Control.
-    Sends only the last GPS position per vehicle in the last minute.
+    Sends only the last GPS position per vehicle in the last 3 minutes.
     """
-    # Define the time range for filtering
-    one_minute_ago = datetime.now(timezone.utc) - timedelta(minutes=3)
+    # Only positions of the last 3 minutes are sent
+    window_start = datetime.now(timezone.utc) - timedelta(minutes=3)
 
-    # Fetch GPS data within the last minute
-    gps_data = await gps_collection.find({
-        "sentToGaussControl": False,
-        "time": {"$gte": one_minute_ago.isoformat() + "Z"}
-    }).to_list(None)
+    if GAUSS_POSITIONS_SOURCE == "memory":
+        await send_latest_positions_to_gauss(window_start)
+        return
+    if GPS_STORAGE_BACKEND == "timeseries":
+        await send_gauss_from_timeseries(window_start)
+        return
+    if GAUSS_DISPATCH_MODE == "claim":
+        await drain_with_claims(
+            "GAUSS", gps_collection, "gauss", "sentToGaussControl",
+            {"sentToGaussControl": False, "timeAt": {"$gte": window_start}},
+            send_latest_of_batch_to_gauss,
+            DISPATCH_CLAIM_BATCH_SIZE, DISPATCH_CLAIM_LEASE_SECONDS,
+            DISPATCH_CLAIM_WORKERS
+        )
+        return
 
-    logger.info("[GAUSS] Task scheduled to send GPS data to Gauss. "
-                f"Total raw payloads: {len(gps_data)}")
+    # Reduce to the latest position per vehicle inside MongoDB
+    cursor = gps_collection.aggregate([
+        {"$match": {
+            "sentToGaussControl": False,
+            "timeAt": {"$gte": window_start}
+        }},
+        {"$sort": {"timeAt": -1}},
+        {"$group": {
+            "_id": "$vehicleNumber",
+            "lat": {"$first": "$lat"},
+            "lng": {"$first": "$lng"},
+            "altitude": {"$first": "$altitude"},
+            "vehicleNumber": {"$first": "$vehicleNumber"},
+            "mileage": {"$first": "$mileage"},
+            "time": {"$first": "$time"},
+            "timeAt": {"$first": "$timeAt"},
+            "speed": {"$first": "$speed"},
+        }}
+    ])
+    filtered_data = await cursor.to_list(None)
 
-    if not gps_data:
+    if not filtered_data:
         logger.info("[GAUSS] No GPS data to process.")
         return
 
-    # Filter to get only the latest position per vehicle
-    latest_positions = {}
-    for record in gps_data:
-        vehicle_number = record["vehicleNumber"]
-        record_time = datetime.strptime(record["time"], "%Y-%m-%dT%H:%M:%SZ")
-        if (vehicle_number not in latest_positions or
-            record_time > datetime.strptime(
-                latest_positions[vehicle_number]["time"],
-                "%Y-%m-%dT%H:%M:%SZ"
-                )):
-            latest_positions[vehicle_number] = record
-
-    # Prepare the filtered data
-    filtered_data = list(latest_positions.values())
     logger.info("[GAUSS] Filtered GPS data to send. "
                 f"Unique vehicles: {len(filtered_data)}")
 
-    # Send the filtered data to Gauss
-    success = await send_gps_data_to_gauss_control(filtered_data)
-    if success:
-        gps_ids = [record["_id"] for record in gps_data]
-        await gps_collection.update_many(
-            {"_id": {"$in": gps_ids}},
-            {"$set": {"sentToGaussControl": True}}
-        )
-        logger.info("[GAUSS] GPS data sent to Gauss Control. Records updated.")
+    # Send the filtered data to Gauss, marking each acknowledged chunk
+    async def send_chunk(chunk: list) -> bool:
+        if not await send_gps_data_to_gauss_control(chunk):
+            return False
+        await mark_gauss_vehicles_sent(chunk, window_start)
+        return True
+
+    sent, _ = await fan_out_chunks(
+        "GAUSS", split_chunks(filtered_data, GAUSS_CHUNK_SIZE),
+        send_chunk, GAUSS_MAX_CONCURRENCY
+    )
+    logger.info("[GAUSS] GPS data sent to Gauss Control. "
+                f"Vehicles updated: {sent}")
 
 # Settup del scheduler
 scheduler = AsyncIOScheduler()
 
 # Schedule jobs
-scheduler.add_job(process_and_send_migtra, CronTrigger(second="0,30"))
-scheduler.add_job(process_and_send_gauss_control, CronTrigger(second="10"))
+# Claim mode is safe to run in every process, the other modes need a leader.
+# The time-series backend dispatches from checkpoints, so it needs a leader.
+MIGTRA_USES_CLAIMS = MIGTRA_DISPATCH_MODE == "claim" and \
+    GPS_STORAGE_BACKEND != "timeseries"
+GAUSS_USES_CLAIMS = GAUSS_DISPATCH_MODE == "claim" and \
+    GPS_STORAGE_BACKEND != "timeseries" and \
+    GAUSS_POSITIONS_SOURCE != "memory"
+
+migtra_trigger = DispatchTrigger(
+    "MIGTRA",
+    process_and_send_migtra if MIGTRA_USES_CLAIMS
+    else leader_only(process_and_send_migtra),
+    DISPATCH_TRIGGER_BATCH_SIZE, DISPATCH_TRIGGER_MAX_LATENCY_MS / 1000
+)
+gauss_trigger = DispatchTrigger(
+    "GAUSS",
+    process_and_send_gauss_control if GAUSS_USES_CLAIMS
+    else leader_only(process_and_send_gauss_control),
+    DISPATCH_TRIGGER_BATCH_SIZE, DISPATCH_TRIGGER_MAX_LATENCY_MS / 1000
+)
+dispatch_triggers = [migtra_trigger, gauss_trigger]
+
+scheduler.add_job(migtra_trigger.run_once, CronTrigger(second="0,30"))
+scheduler.add_job(gauss_trigger.run_once, CronTrigger(second="10"))
 
 
 def start_scheduler():
+    if SCHEDULER_LEADER_ELECTION:
+        scheduler_lease.start()
+    if DISPATCH_TRIGGER_MODE == "event":
+        for trigger in dispatch_triggers:
+            trigger.start()
+            ingest_listeners.append(trigger.signal)
     scheduler.start()
+
+
+async def stop_scheduler():
+    for trigger in dispatch_triggers:
+        if trigger.signal in ingest_listeners:
+            ingest_listeners.remove(trigger.signal)
+        await trigger.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await scheduler_lease.release()
@@ -0,0 +1,130 @@
+from app.services.migtra_service import (
+    send_gps_data_to_migtra_or_retry
+)
+from app.services.gauss_service import send_gps_data_to_gauss_control
+from app.utils.database import (
+    gps_positions_ts_collection,
+    dispatch_checkpoints_collection
+)
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+
+logger = logging.getLogger("apscheduler")
+
+# Time-series measurements cannot carry "sent" flags, so each destination
+# keeps a checkpoint over (receivedAt, _id) instead
+TIMESERIES_PROJECTION = {
+    "id": 1, "vehicleNumber": "$vehicle.vehicleNumber", "time": 1,
+    "receivedAt": 1, "lat": 1, "lng": 1, "altitude": 1, "speed": 1,
+    "angle": 1, "hdop": 1, "acc": 1, "mileage": 1
+}
+# `receivedAt` is stamped right before the insert (at flush time with
+# buffered ingest), so a position can be written after newer ones. Only
+# positions received this long ago are read, so the checkpoint never moves
+# past one that is not written yet
+TIMESERIES_DISPATCH_LAG_SECONDS = \
+    float(os.getenv("TIMESERIES_DISPATCH_LAG_SECONDS", "10"))
+
+
+def received_cutoff() -> datetime:
+    return datetime.now(timezone.utc) - \
+        timedelta(seconds=TIMESERIES_DISPATCH_LAG_SECONDS)
+
+
+async def get_checkpoint(destination: str) -> dict:
+    checkpoint = await dispatch_checkpoints_collection.find_one(
+        {"_id": destination}
+    )
+    return checkpoint or {}
+
+
+async def save_checkpoint(destination: str, **fields):
+    await dispatch_checkpoints_collection.update_one(
+        {"_id": destination},
+        {"$set": {**fields, "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+async def send_migtra_from_timeseries(chunk_size: int):
+    """
+    Send positions received after the Migtra checkpoint and before the
+    ingest lag cutoff, in chunks ordered by (receivedAt, _id). The
+    checkpoint moves only after each acknowledged chunk.
+    """
+    checkpoint = await get_checkpoint("migtra")
+    cutoff = received_cutoff()
+    sent = 0
+    while True:
+        query = {"receivedAt": {"$lt": cutoff}}
+        if checkpoint.get("receivedAt"):
+            query["$or"] = [
+                {"receivedAt": {"$gt": checkpoint["receivedAt"]}},
+                {"receivedAt": checkpoint["receivedAt"],
+                 "_id": {"$gt": checkpoint["lastId"]}}
+            ]
+        chunk = await gps_positions_ts_collection.find(
+            query, TIMESERIES_PROJECTION
+        ).sort([("receivedAt", 1), ("_id", 1)]) \
+            .limit(chunk_size).to_list(None)
+        if not chunk:
+            break
+        if not await send_gps_data_to_migtra_or_retry(chunk):
+            logger.error("[MIGTRA] Chunk failed. Stopping this run. "
+                         f"Records sent: {sent}")
+            return
+        checkpoint = {
+            "receivedAt": chunk[-1]["receivedAt"],
+            "lastId": chunk[-1]["_id"]
+        }
+        await save_checkpoint("migtra", **checkpoint)
+        sent += len(chunk)
+
+    logger.info("[MIGTRA] GPS data sent to Migtra from time-series. "
+                f"Records sent: {sent}")
+
+
+async def send_gauss_from_timeseries(window_start: datetime):
+    """
+    Send the latest position per vehicle received after the Gauss
+    checkpoint and inside the time window.
+    """
+    checkpoint = await get_checkpoint("gauss")
+    match = {
+        "timestamp": {"$gte": window_start},
+        "receivedAt": {"$lt": received_cutoff()}
+    }
+    if checkpoint.get("receivedAt"):
+        match["receivedAt"]["$gt"] = checkpoint["receivedAt"]
+
+    cursor = gps_positions_ts_collection.aggregate([
+        {"$match": match},
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": "$vehicle.vehicleNumber",
+            "lat": {"$first": "$lat"},
+            "lng": {"$first": "$lng"},
+            "altitude": {"$first": "$altitude"},
+            "vehicleNumber": {"$first": "$vehicle.vehicleNumber"},
+            "mileage": {"$first": "$mileage"},
+            "time": {"$first": "$time"},
+            "timeAt": {"$first": "$timestamp"},
+            "speed": {"$first": "$speed"},
+            "receivedAt": {"$max": "$receivedAt"},
+        }}
+    ])
+    latest = await cursor.to_list(None)
+    if not latest:
+        logger.info("[GAUSS] No GPS data to process.")
+        return
+
+    logger.info("[GAUSS] Filtered GPS data to send. "
+                f"Unique vehicles: {len(latest)}")
+    if await send_gps_data_to_gauss_control(latest):
+        await save_checkpoint(
+            "gauss",
+            receivedAt=max(record["receivedAt"] for record in latest)
+        )
+        logger.info("[GAUSS] GPS data sent to Gauss Control. "
+                    "Checkpoint updated.")
@@ -1,16 +1,37 @@
 from fastapi import FastAPI
+import asyncio
 import os
 import app.utils.logging_config as logging_config  # noqa: F401
 from app.routes.gps_routes import gps_webhook_router, gps_router
 from app.routes.alarm_routes import alarm_webhook_router, alarms_router
+from app.routes.admin_routes import admin_router
 from app.utils.database import setup_indexes
-from app.jobs.scheduler import start_scheduler
+from app.utils.http_clients import start_http_clients, close_http_clients
+from app.services.gps_service import (
+    rebuild_latest_positions,
+    LATEST_POSITIONS_REBUILD,
+    start_ingest_buffers,
+    stop_ingest_buffers
+)
+from app.services.alarm_service import (
+    alarm_dispatcher,
+    run_alarm_pairing_sweeper
+)
+from app.utils.retry_queue import (
+    dispatch_retry_queue,
+    DISPATCH_RETRY_ENABLED,
+    DISPATCH_RETRY_POLL_SECONDS
+)
+from app.jobs.scheduler import start_scheduler, stop_scheduler
 
 SCHEDULER_TO_SEND_GPS_ACTIVATE = \
     os.getenv("SCHEDULER_TO_SEND_GPS_ACTIVATE", "false").lower() == 'true'
 
 app = FastAPI(title="Visionline API Integration")
 
+# Background tasks owned by the app lifecycle
+background_tasks = []
+
 # Register the routers
 app.include_router(gps_webhook_router)
 app.include_router(gps_router)
@@ -18,14 +39,36 @@ app.include_router(gps_router)
 app.include_router(alarm_webhook_router)
 app.include_router(alarms_router)
 
+app.include_router(admin_router)
+
 
 @app.on_event("startup")
 async def startup_event():
     await setup_indexes()
+    start_http_clients()
+    if LATEST_POSITIONS_REBUILD:
+        await rebuild_latest_positions()
+    start_ingest_buffers()
+    alarm_dispatcher.start()
+    background_tasks.append(asyncio.create_task(run_alarm_pairing_sweeper()))
+    if DISPATCH_RETRY_ENABLED:
+        background_tasks.append(asyncio.create_task(
+            dispatch_retry_queue.run(DISPATCH_RETRY_POLL_SECONDS)
+        ))
     if SCHEDULER_TO_SEND_GPS_ACTIVATE:
         start_scheduler()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    await stop_scheduler()
+    await stop_ingest_buffers()
+    await alarm_dispatcher.stop()
+    await close_http_clients()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Visionline API-Middleware"}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Any
 from datetime import datetime
 
@@ -50,6 +50,34 @@ class GPSRecord(BaseModel):
         from_attributes = True
 
 
+class LatestPositionRecord(BaseModel):
+    vehicleNumber: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    speed: Optional[float] = None
+    angle: Optional[int] = None
+    altitude: Optional[int] = None
+    mileage: Optional[float] = None
+    time: str
+    receivedAt: Optional[datetime] = None
+
+
+class GPSBatchRequest(BaseModel):
+    vehicles: List[str] = Field(..., min_length=1, max_length=1000)
+    start_time: Optional[str] = None
+    limit_per_vehicle: int = Field(1, ge=1, le=100)
+
+
+class VehiclePositionRecord(BaseModel):
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    speed: Optional[float] = None
+    angle: Optional[int] = None
+    altitude: Optional[int] = None
+    time: Optional[str] = None
+    receivedAt: Optional[datetime] = None
+
+
 class GPSIntegrationRecord(BaseModel):
     payloadId: str
     sentAt: datetime
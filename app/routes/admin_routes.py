@@ -0,0 +1,92 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.services.alarm_service import alarm_dispatcher
+from app.utils.retry_queue import dispatch_retry_queue
+from app.utils.circuit_breaker import circuit_breakers
+from typing import Optional
+
+admin_router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@admin_router.get("/alarm-dispatcher",
+                  summary="Estado del despacho de alarmas a Gauss")
+async def get_alarm_dispatcher_stats():
+    """
+    Endpoint to retrieve the queue depth and delivery lag of the
+    alarm dispatcher.
+    """
+    return alarm_dispatcher.stats()
+
+
+@admin_router.get("/circuit-breakers",
+                  summary="Estado de los circuit breakers por destino")
+async def get_circuit_breakers():
+    """
+    Endpoint to retrieve the state, adaptive timeout and latency of the
+    circuit breaker of each destination.
+    """
+    return [breaker.stats() for breaker in circuit_breakers.values()]
+
+
+@admin_router.get("/retry-queue",
+                  summary="Estado de la cola de reintentos por destino")
+async def get_retry_queue_stats():
+    """
+    Endpoint to retrieve the pending retry batches and dead letters
+    per destination.
+    """
+    return await dispatch_retry_queue.stats()
+
+
+@admin_router.get("/dead-letters",
+                  summary="Obtener lotes descartados tras agotar reintentos")
+async def get_dead_letters(
+    destination: Optional[str] = Query(
+        None,
+        description="Filtro opcional: Destino "
+        "(e.g., 'migtra', 'gauss_alarms')"),
+    limit: int = Query(
+        100, ge=1, le=1000,
+        description="Número máximo de lotes a retornar"),
+    include_records: bool = Query(
+        False, description="Incluir los registros de cada lote")
+):
+    """
+    Endpoint to inspect dead-letter batches, newest first.
+    """
+    letters = await dispatch_retry_queue.list_dead_letters(
+        destination, limit, include_records
+    )
+    return jsonable_encoder(letters, custom_encoder={ObjectId: str})
+
+
+@admin_router.post("/dead-letters/replay",
+                   summary="Reintentar todos los lotes descartados")
+async def replay_dead_letters(
+    destination: Optional[str] = Query(
+        None,
+        description="Filtro opcional: Solo los lotes de este destino")
+):
+    """
+    Endpoint to move dead-letter batches back to the retry queue.
+    """
+    query = {"destination": destination} if destination else {}
+    replayed = await dispatch_retry_queue.replay_dead_letters(query)
+    return {"status": "replayed", "count": replayed}
+
+
+@admin_router.post("/dead-letters/{letterId}/replay",
+                   summary="Reintentar un lote descartado")
+async def replay_dead_letter(letterId: str):
+    """
+    Endpoint to move one dead-letter batch back to the retry queue.
+    """
+    try:
+        letter_id = ObjectId(letterId)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="`letterId` inválido")
+    if not await dispatch_retry_queue.replay_dead_letter(letter_id):
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    return {"status": "replayed", "count": 1}
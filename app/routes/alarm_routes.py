@@ -1,12 +1,20 @@
-from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi import APIRouter, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
 from app.models.alarm_data import AlarmPayload, AlarmRecord
-from app.services.alarm_service import process_alarm_data, get_alarms_data
+from app.services.alarm_service import (
+    process_alarm_data,
+    get_alarms_data,
+    build_alarms_pipeline,
+    stream_alarms_ndjson
+)
 import os
 import json
 from typing import List, Optional
 
 TENANT_ID = os.getenv("TENANT_ID")
+# "full" echoes the payload, "lean" only returns counts and the payload id
+WEBHOOK_ACK_MODE = os.getenv("WEBHOOK_ACK_MODE", "full").lower()
 
 alarm_webhook_router = APIRouter(
     prefix="/webhook/alarms", tags=["Webhook Alarm Data"]
@@ -18,19 +26,18 @@ alarm_webhook_router = APIRouter(
 async def receive_alarm_data(request: Request):
     """
     Endpoint to receive alarm data.
+    The body is validated straight from the raw bytes.
     """
+    raw_body = await request.body()
     try:
-        # Read the raw body of the request
-        raw_body = await request.body()
-        payload_dict = json.loads(raw_body)
-    except json.JSONDecodeError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid JSON: {e}"
-        )
-    try:
-        payload = AlarmPayload(**payload_dict)
+        payload = AlarmPayload.model_validate_json(raw_body)
     except ValidationError as ve:
+        if any(error["type"] == "json_invalid" for error in ve.errors()):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid JSON: {ve}"
+            )
+        payload_dict = json.loads(raw_body)
         print("Validation error:", ve)
         print("Payload dict:", payload_dict)
         return {
@@ -43,16 +50,16 @@ async def receive_alarm_data(request: Request):
           f"Data count: {len(payload.data)}")
 
     # Check type and tenant ID
-    if payload_dict["type"] != "ALARM":
+    if payload.type != "ALARM":
         print("Invalid payload type. Expected 'ALARM' "
-              f"and received: {payload_dict['type']}.")
+              f"and received: {payload.type}.")
         return {
             "status": "received",
-            "data": payload_dict,
+            "data": payload.dict(),
             'error': "Invalid payload type. "
-                     f"Expected ALARM and received {payload_dict['type']}"
+                     f"Expected ALARM and received {payload.type}"
         }
-    if str(payload_dict["tenantId"]) != TENANT_ID:
+    if str(payload.tenantId) != TENANT_ID:
         raise HTTPException(status_code=403, detail="Invalid tenant ID")
 
     result = await process_alarm_data(payload)
@@ -60,6 +67,12 @@ async def receive_alarm_data(request: Request):
         print(f"Error processing ALARM data: {result['message']}")
         raise HTTPException(status_code=400, detail=result["message"])
 
+    if WEBHOOK_ACK_MODE == "lean":
+        return {
+            "status": "received",
+            "payloadId": result["payloadId"],
+            "count": len(payload.data)
+        }
     return {"status": "received", "data": payload.dict()}
 
 
@@ -71,6 +84,7 @@ alarms_router = APIRouter(prefix="/alarms", tags=["Alarms Data Retrieval"])
                    summary="Obtener datos de Alarms. "
                            "Opcional: por número de vehículo")
 async def get_gps_records(
+    response: Response,
     vehicleNumber: Optional[str] = Query(
         None,
         description="Filtro opcional: Número de Vehículo: "
@@ -78,16 +92,39 @@ async def get_gps_records(
     start_time: Optional[str] = Query(
         None,
         description="Filtro opcional: Tiempo mínimo "
-        "en ISO 8601 (e.g., '2024-12-24T21:00:00Z')")
+        "en ISO 8601 (e.g., '2024-12-24T21:00:00Z')"),
+    limit: int = Query(
+        1000, ge=1, le=10000,
+        description="Número máximo de registros a retornar"),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor de la página siguiente, "
+        "tomado del header X-Next-Cursor"),
+    format: str = Query(
+        "json", pattern="^(json|ndjson)$",
+        description="'json' retorna una página, "
+        "'ndjson' transmite todos los registros sin límite")
 ):
     """
     Endpoint to retrieve Alarms data. Optionally by vehicle number.
+    JSON responses are paged with a cursor returned in the X-Next-Cursor
+    header. NDJSON responses stream every matching alarm.
     """
     print(f"[Alarms] Requesting Alarms. Vehicle: {vehicleNumber}, ")
     try:
-        results = await get_alarms_data(
-            vehicleNumber, start_time
+        if format == "ndjson":
+            aggregation_pipeline = build_alarms_pipeline(
+                vehicleNumber, start_time, None, cursor
+            )
+            return StreamingResponse(
+                stream_alarms_ndjson(aggregation_pipeline),
+                media_type="application/x-ndjson"
+            )
+        results, next_cursor = await get_alarms_data(
+            vehicleNumber, start_time, limit, cursor
         )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return results
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
@@ -1,12 +1,31 @@
-from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi import APIRouter, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
-from app.models.gps_data import GPSPayload, GPSRecord
-from app.services.gps_service import process_gps_data, get_gps_data_by_vehicle
+from app.models.gps_data import (
+    GPSPayload,
+    GPSRecord,
+    LatestPositionRecord,
+    GPSBatchRequest,
+    VehiclePositionRecord
+)
+from app.services.gps_service import (
+    process_gps_data,
+    get_gps_data_by_vehicle,
+    get_gps_data_by_vehicles,
+    get_gps_history_page,
+    get_latest_positions,
+    build_gps_export_query,
+    stream_gps_export,
+    GPS_HISTORY_PAGED
+)
+from app.utils.track_simplify import simplify_track
 import os
 import json
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 TENANT_ID = os.getenv("TENANT_ID")
+# "full" echoes the payload, "lean" only returns counts and the payload id
+WEBHOOK_ACK_MODE = os.getenv("WEBHOOK_ACK_MODE", "full").lower()
 
 gps_webhook_router = APIRouter(
     prefix="/webhook/gps", tags=["Webhook GPS Data"]
@@ -18,20 +37,20 @@ gps_webhook_router = APIRouter(
 async def receive_gps_data(request: Request):
     """
     Endpoint to receive GPS data from Visionaline devices.
+    The body is validated straight from the raw bytes.
     """
+    raw_body = await request.body()
     try:
-        raw_body = await request.body()
-        payload_dict = json.loads(raw_body)
-    except json.JSONDecodeError as e:
-        print(f"Invalid JSON: {e}")
-        print(f"Raw body: {raw_body}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid JSON: {e}"
-        )
-    try:
-        payload = GPSPayload(**payload_dict)
+        payload = GPSPayload.model_validate_json(raw_body)
     except ValidationError as ve:
+        if any(error["type"] == "json_invalid" for error in ve.errors()):
+            print(f"Invalid JSON: {ve}")
+            print(f"Raw body: {raw_body}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid JSON: {ve}"
+            )
+        payload_dict = json.loads(raw_body)
         print("Validation error:", ve)
         print("Payload dict:", payload_dict)
         return {
@@ -49,7 +68,7 @@ async def receive_gps_data(request: Request):
               f"and received '{payload.type}'")
         return {
             "status": "received",
-            "data": payload_dict,
+            "data": payload.dict(),
             'error': "Invalid payload type. "
                      f"Expected GPS and received {payload.type}"
         }
@@ -61,17 +80,124 @@ async def receive_gps_data(request: Request):
         print(f"Error processing GPS data: {result['message']}")
         raise HTTPException(status_code=400, detail=result["message"])
 
+    if WEBHOOK_ACK_MODE == "lean":
+        return {
+            "status": "received",
+            "payloadId": result["payloadId"],
+            "count": len(payload.data),
+            "duplicates": result["duplicates"]
+        }
     return {"status": "received", "data": payload.dict()}
 
 
 gps_router = APIRouter(prefix="/gps", tags=["GPS Data Retrieval"])
 
 
+@gps_router.get("/latest",
+                response_model=List[LatestPositionRecord],
+                summary="Obtener la última posición de cada vehículo")
+async def get_latest_gps_records():
+    """
+    Endpoint to retrieve the last known position of every vehicle.
+    Served from memory, without a database round trip.
+    """
+    return get_latest_positions()
+
+
+@gps_router.post("/batch",
+                 response_model=Dict[str, List[VehiclePositionRecord]],
+                 summary="Obtener las últimas posiciones de varios vehículos")
+async def get_gps_records_batch(request: GPSBatchRequest):
+    """
+    Endpoint to retrieve the latest positions of several vehicles in a
+    single query. Results are grouped by vehicle number. Without
+    `start_time`, several positions per vehicle come from the last hours
+    only (`GPS_BATCH_WINDOW_HOURS`).
+    """
+    print(f"[GPS] Requesting GPS data for {len(request.vehicles)} vehicles")
+    try:
+        return await get_gps_data_by_vehicles(
+            request.vehicles, request.start_time, request.limit_per_vehicle
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@gps_router.get("/export",
+                summary="Exportar posiciones GPS por rango de tiempo")
+async def export_gps_records(
+    start_time: str = Query(
+        ...,
+        description="Tiempo mínimo en ISO 8601 "
+        "(e.g., '2024-12-24T00:00:00Z')"),
+    end_time: Optional[str] = Query(
+        None,
+        description="Filtro opcional: Tiempo máximo (exclusivo) "
+        "en ISO 8601. Por defecto, ahora"),
+    vehicles: Optional[List[str]] = Query(
+        None,
+        description="Filtro opcional: Números de vehículo. "
+        "Repetir el parámetro o separar por comas"),
+    format: str = Query(
+        "ndjson", pattern="^(ndjson|csv)$",
+        description="Formato de salida: 'ndjson' o 'csv'"),
+    compress: bool = Query(
+        True, description="Comprimir la respuesta con gzip"),
+    simplify: Optional[str] = Query(
+        None, pattern="^(dp|bucket)$",
+        description="Filtro opcional: Simplificar cada recorrido. "
+        "'dp' (Douglas-Peucker) o 'bucket' (un punto por intervalo)"),
+    tolerance_m: float = Query(
+        10, gt=0,
+        description="Tolerancia en metros para 'dp'"),
+    bucket_seconds: int = Query(
+        60, ge=1,
+        description="Tamaño del intervalo en segundos para 'bucket'")
+):
+    """
+    Endpoint to export GPS positions in a time range, optionally for a list
+    of vehicles. Rows are streamed from the database, grouped by vehicle in
+    descending order and ascending in time within each vehicle.
+    """
+    if vehicles:
+        vehicles = [
+            vehicle.strip()
+            for value in vehicles for vehicle in value.split(",")
+            if vehicle.strip()
+        ]
+    print(f"[GPS] Exporting GPS data from {start_time} to {end_time}. "
+          f"Vehicles: {len(vehicles) if vehicles else 'all'}")
+    try:
+        collection, query, sort, projection = build_gps_export_query(
+            start_time, end_time, vehicles
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    headers = {
+        "Content-Disposition":
+            f"attachment; filename=gps_export.{format}"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_gps_export(
+            collection, query, sort, projection, format, compress,
+            simplify, tolerance_m, bucket_seconds
+        ),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers
+    )
+
+
 @gps_router.get("/{vehicleNumber}",
                 response_model=List[GPSRecord],
                 summary="Obtener datos GPS por número de vehículo")
 async def get_gps_records(
     vehicleNumber: str,
+    response: Response,
     start_time: Optional[str] = Query(
         None,
         description="Filtro opcional: Tiempo mínimo "
@@ -81,16 +207,47 @@ async def get_gps_records(
         description="Número máximo de registros a retornar"),
     skip: int = Query(
         0, ge=0,
-        description="Número de registros a omitir")
+        description="Número de registros a omitir. "
+        "Ignorado cuando se usa el historial por posición"),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor de la página siguiente, "
+        "tomado del header X-Next-Cursor"),
+    simplify: Optional[str] = Query(
+        None, pattern="^(dp|bucket)$",
+        description="Filtro opcional: Simplificar el recorrido. "
+        "'dp' (Douglas-Peucker) o 'bucket' (un punto por intervalo)"),
+    tolerance_m: float = Query(
+        10, gt=0,
+        description="Tolerancia en metros para 'dp'"),
+    bucket_seconds: int = Query(
+        60, ge=1,
+        description="Tamaño del intervalo en segundos para 'bucket'")
 ):
     """
     Endpoint to retrieve GPS data by vehicle number.
+    With the per-position history enabled, pages are read with a cursor
+    and the next one is returned in the X-Next-Cursor header.
+    With `simplify`, each page is simplified after it is read, so the
+    cursor still points after the last stored position of the page.
     """
     print(f"[GPS] Requesting GPS data for vehicle {vehicleNumber}")
     try:
-        results = await get_gps_data_by_vehicle(
-            vehicleNumber, start_time, limit, skip
-        )
+        if GPS_HISTORY_PAGED:
+            results, next_cursor = await get_gps_history_page(
+                vehicleNumber, start_time, limit, cursor
+            )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+        else:
+            results = await get_gps_data_by_vehicle(
+                vehicleNumber, start_time, limit, skip
+            )
+        if simplify:
+            results = simplify_track(
+                results, simplify, tolerance_m, bucket_seconds,
+                time_field="positionTime"
+            )
         return results
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
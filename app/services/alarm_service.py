@@ -1,19 +1,80 @@
-from app.utils.database import alarms_collection, alarms_payload_collection
+from app.utils.database import (
+    alarms_collection,
+    alarms_payload_collection,
+    alarm_pairs_collection
+)
 from app.utils.alarm_types import ALARM_TYPE_DESCRIPTIONS, ALARMS_GAUSS_MAPPING
 from app.models.alarm_data import AlarmPayload
 from app.services.gauss_service import send_alarms_to_gauss
+from app.utils.background_dispatcher import BackgroundDispatcher
+from app.utils.retry_queue import dispatch_retry_queue
+from app.utils.time_utils import (
+    format_gauss_time,
+    parse_iso_time,
+    parse_iso_time_or_none
+)
+from app.utils.alarm_pairing import (
+    MemoryAlarmPairingStore,
+    MongoAlarmPairingStore
+)
+from bson import ObjectId
+from bson.errors import InvalidId
+import asyncio
+import base64
+import binascii
+import json
 import os
+import uuid
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 LOG_ALARM_PAYLOAD = os.getenv("LOG_ALARM_PAYLOAD", "false").lower() == 'true'
 LOG_ALARM_DATA = os.getenv("LOG_ALARM_DATA", "false").lower() == 'true'
+ALARM_DISPATCH_WORKERS = int(os.getenv("ALARM_DISPATCH_WORKERS", "4"))
+ALARM_DISPATCH_QUEUE_SIZE = \
+    int(os.getenv("ALARM_DISPATCH_QUEUE_SIZE", "10000"))
+# Completed alarms are posted to Gauss in batches bounded by count and time
+ALARM_BATCH_SIZE = int(os.getenv("ALARM_BATCH_SIZE", "50"))
+ALARM_BATCH_LINGER_MS = float(os.getenv("ALARM_BATCH_LINGER_MS", "200"))
+# "memory" pairs START/END in this process, "mongo" shares pairs across workers
+ALARM_PAIRING_STORE = os.getenv("ALARM_PAIRING_STORE", "memory").lower()
+ALARM_PAIR_TTL_SECONDS = float(os.getenv("ALARM_PAIR_TTL_SECONDS", "3600"))
+ALARM_PAIR_MAX_ENTRIES = int(os.getenv("ALARM_PAIR_MAX_ENTRIES", "10000"))
+ALARM_PAIR_SWEEP_SECONDS = float(os.getenv("ALARM_PAIR_SWEEP_SECONDS", "60"))
+
+if ALARM_PAIRING_STORE == "mongo":
+    alarm_pairing_store = MongoAlarmPairingStore(
+        alarm_pairs_collection, ALARM_PAIR_TTL_SECONDS
+    )
+else:
+    alarm_pairing_store = MemoryAlarmPairingStore(
+        ALARM_PAIR_TTL_SECONDS, ALARM_PAIR_MAX_ENTRIES
+    )
+
+
+send_alarms_to_gauss_or_retry = dispatch_retry_queue.wrap(
+    "gauss_alarms", send_alarms_to_gauss
+)
+
+
+async def deliver_alarms(alarms: List[dict]) -> bool:
+    """
+    Deliver a batch of completed alarms to Gauss in a single POST.
+    Runs in the dispatcher workers.
+    """
+    return await send_alarms_to_gauss_or_retry(alarms)
 
-alarm_cache = {}
+
+alarm_dispatcher = BackgroundDispatcher(
+    "GAUSS ALARMS", deliver_alarms,
+    ALARM_DISPATCH_WORKERS, ALARM_DISPATCH_QUEUE_SIZE,
+    ALARM_BATCH_SIZE, ALARM_BATCH_LINGER_MS / 1000
+)
 
 
 async def process_alarm_data(payload: AlarmPayload):
     try:
+        payload_id = str(uuid.uuid4())
         if LOG_ALARM_DATA:
             for alarm_data in payload.data:
                 document = alarm_data.dict()
@@ -22,9 +83,11 @@ async def process_alarm_data(payload: AlarmPayload):
 
         if LOG_ALARM_PAYLOAD:
             payload_doc = {
+                "payloadId": payload_id,
                 "tenantId": payload.tenantId,
                 "type": payload.type,
                 "time": payload.time,
+                "timeAt": parse_iso_time_or_none(payload.time),
                 "receivedAt": datetime.now(timezone.utc),
                 "dataCount": len(payload.data),
                 "data": [alarm_data.dict() for alarm_data in payload.data]
@@ -36,17 +99,50 @@ async def process_alarm_data(payload: AlarmPayload):
             await handle_alarm_for_gauss(alarm_data)
         return {
             "status": "success",
-            "message": "ALARM data processed successfully"
+            "message": "ALARM data processed successfully",
+            "payloadId": payload_id
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-async def get_alarms_data(
+# Alarm types as strings and their descriptions, at the same positions.
+# Looked up with $indexOfArray, which accepts a per-document value
+ALARM_CODES = [str(code) for code in ALARM_TYPE_DESCRIPTIONS]
+ALARM_DESCRIPTIONS = list(ALARM_TYPE_DESCRIPTIONS.values())
+
+
+def encode_alarms_cursor(document: dict) -> str:
+    """
+    Build the opaque cursor pointing after `document`.
+    """
+    raw = json.dumps({
+        "t": document["timeAt"].isoformat()
+        if document.get("timeAt") else None,
+        "id": str(document["_id"]),
+        "i": document["dataIndex"]
+    })
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_alarms_cursor(cursor: str) -> Tuple[datetime, ObjectId, int]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return parse_iso_time(raw["t"]), ObjectId(raw["id"]), int(raw["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("`cursor` inválido")
+
+
+def build_alarms_pipeline(
         vehicle_number: Optional[str] = None,
-        start_time: Optional[str] = None) -> List[dict]:
+        start_time: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None) -> List[dict]:
     """
-    Get all alarms data. Optionally filter by vehicle number.
+    Build the alarms query, newest first. Rows are ordered by
+    (timeAt, payload _id, position in the payload) so a cursor can resume
+    right after the last row returned.
+    Raises ValueError for invalid `start_time` or `cursor`.
     """
     match_filter = {
         'type': 'ALARM'
@@ -54,7 +150,28 @@ async def get_alarms_data(
     if vehicle_number:
         match_filter['data.vehicleNumber'] = vehicle_number
     if start_time:
-        match_filter['time'] = {'$gt': start_time}
+        try:
+            match_filter['timeAt'] = {'$gt': parse_iso_time(start_time)}
+        except ValueError:
+            raise ValueError(
+                "`start_time` debe estar en formato ISO 8601, "
+                "por ejemplo '2024-12-24T21:00:00Z'"
+            )
+
+    row_filter = {}
+    if vehicle_number:
+        row_filter['data.vehicleNumber'] = vehicle_number
+    if cursor:
+        cursor_time, cursor_id, cursor_index = decode_alarms_cursor(cursor)
+        match_filter['$or'] = [
+            {'timeAt': {'$lt': cursor_time}},
+            {'timeAt': cursor_time, '_id': {'$lt': cursor_id}},
+            {'_id': cursor_id}
+        ]
+        row_filter['$or'] = [
+            {'_id': {'$ne': cursor_id}},
+            {'dataIndex': {'$gt': cursor_index}}
+        ]
 
     aggregation_pipeline = [
         {
@@ -62,45 +179,128 @@ async def get_alarms_data(
         },
         {
             '$sort': {
-                'time': -1
+                'timeAt': -1,
+                '_id': -1
             }
         }, {
             '$unwind': {
-                'path': '$data'
-            }
-        }, {
-            '$project': {
-                '_id': '$_id',
-                'alarmCode': '$data.alarmType',
-                'vehicleNumber': '$data.vehicleNumber',
-                'time': '$time',
-                'action': '$data.action',
-                'speed': '$data.gpsSpeed',
+                'path': '$data',
+                'includeArrayIndex': 'dataIndex'
             }
         }
     ]
-    if vehicle_number:
+    if row_filter:
         aggregation_pipeline.append({
-            '$match': {
-                'vehicleNumber': vehicle_number
-            }
+            '$match': row_filter
         })
+    if limit:
+        aggregation_pipeline.append({
+            '$limit': limit
+        })
+    aggregation_pipeline.append({
+        '$project': {
+            '_id': '$_id',
+            'timeAt': '$timeAt',
+            'dataIndex': '$dataIndex',
+            'alarmCode': '$data.alarmType',
+            'vehicleNumber': '$data.vehicleNumber',
+            'time': '$time',
+            'action': '$data.action',
+            'speed': '$data.gpsSpeed',
+            'alarmDescription': {'$let': {
+                'vars': {'index': {'$indexOfArray': [
+                    {'$literal': ALARM_CODES},
+                    {'$toString': {'$ifNull': ['$data.alarmType', '']}}
+                ]}},
+                'in': {'$cond': [
+                    {'$gte': ['$$index', 0]},
+                    {'$arrayElemAt': [
+                        {'$literal': ALARM_DESCRIPTIONS}, '$$index'
+                    ]},
+                    'Unknown Alarm'
+                ]}
+            }}
+        }
+    })
+    return aggregation_pipeline
+
+
+async def get_alarms_data(
+        vehicle_number: Optional[str] = None,
+        start_time: Optional[str] = None,
+        limit: int = 1000,
+        cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Get a page of alarms data. Optionally filter by vehicle number.
+    Returns the page and the cursor of the next page, if any.
+    """
+    aggregation_pipeline = build_alarms_pipeline(
+        vehicle_number, start_time, limit + 1, cursor
+    )
+    results = await alarms_payload_collection \
+        .aggregate(aggregation_pipeline).to_list(None)
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_alarms_cursor(results[-1])
+    return results, next_cursor
 
-    cursor = alarms_payload_collection.aggregate(aggregation_pipeline)
-    results = []
+
+async def stream_alarms_ndjson(
+        aggregation_pipeline: List[dict]) -> AsyncIterator[bytes]:
+    """
+    Stream alarms as NDJSON straight from the aggregation cursor.
+    """
+    cursor = alarms_payload_collection.aggregate(
+        aggregation_pipeline, batchSize=1000
+    )
     async for document in cursor:
-        document['alarmDescription'] = ALARM_TYPE_DESCRIPTIONS.get(
-            int(document['alarmCode']), 'Unknown Alarm'
-        )
-        results.append(document)
+        document['_id'] = str(document['_id'])
+        document['timeAt'] = document['timeAt'].isoformat() \
+            if document.get('timeAt') else None
+        yield (json.dumps(document) + "\n").encode()
 
-    return results
+
+def build_alarm_half(alarm_data, alert_name: str, alert_type: str) -> dict:
+    """
+    Build the Gauss alarm fields carried by a START or END event.
+    """
+    speed_limit = None
+    if alarm_data.alarmType == 8 and alarm_data.alarmAdditionalInfo:
+        speed_limit = \
+            float(alarm_data.alarmAdditionalInfo.get("speedLimit", 0)) / 100
+
+    if alarm_data.action == "START":
+        event_time = {"start": format_gauss_time(alarm_data.startTime)}
+    else:
+        event_time = {"end": format_gauss_time(alarm_data.endTime)}
+
+    half = {
+        **event_time,
+        "latitude": float(alarm_data.gpsLat),
+        "longitude": float(alarm_data.gpsLng),
+        "altitude": float(alarm_data.gpsAltitude or 0),
+        "vehicleCode": alarm_data.vehicleNumber.split()[0],
+        "alertName": alert_name,
+        "type": alert_type,
+        "driverCode": alarm_data.driverName,
+        "serializedMetaData":
+            {"speedLimit": speed_limit} if alarm_data.alarmType == 8
+            else {"speed": float(alarm_data.gpsSpeed or 0)},
+    }
+    if alarm_data.alarmType == 8:
+        half.update({
+            "metricUnit": "km/h",
+            "value": float(alarm_data.gpsSpeed or 0),
+        })
+    return half
 
 
 async def handle_alarm_for_gauss(alarm_data: dict):
     """
     Handle alarm data for Gauss. If the alarm is not complete (START and END),
-    it will be saved in a cache until the other part is received.
+    it will be saved in the pairing store until the other part is received.
     """
     alarm_id = alarm_data.alarmId
     action = alarm_data.action
@@ -111,92 +311,41 @@ async def handle_alarm_for_gauss(alarm_data: dict):
     if alert_name == "Unknown":
         print(f"[WEBHOOK-ALARMS] Unknown alarm type: {alarm_data.alarmType}")
         return False
+    if action not in ("START", "END"):
+        return False
 
-    speed_limit = None
-    if alarm_data.alarmType == 8 and alarm_data.alarmAdditionalInfo:
-        speed_limit = \
-            float(alarm_data.alarmAdditionalInfo.get("speedLimit", 0)) / 100
+    half = build_alarm_half(alarm_data, alert_name, alert_type)
+    complete_alarm = await alarm_pairing_store.merge(alarm_id, action, half)
+    if complete_alarm is None:
+        print(f"[WEBHOOK-ALARMS] Saving {action} alarm {alarm_id} "
+              "in pairing store.")
+        return False
 
-    if action == "START":
-        if alarm_id in alarm_cache and "end" in alarm_cache[alarm_id]:
-            print("[WEBHOOK-ALARMS] Found END before "
-                  f"START for alarm {alarm_id}. Sending to Gauss.")
-            cached_alarm = alarm_cache.pop(alarm_id)
-            cached_alarm.update({
-                "start": datetime
-                        .strptime(alarm_data.startTime, "%Y-%m-%dT%H:%M:%SZ")
-                        .strftime("%Y-%m-%d %H:%M:%S"),
-                "latitude": float(alarm_data.gpsLat),
-                "longitude": float(alarm_data.gpsLng),
-                "altitude": float(alarm_data.gpsAltitude or 0),
-                "vehicleCode": alarm_data.vehicleNumber.split()[0],
-                "alertName": alert_name,
-                "type": alert_type,
-                "driverCode": alarm_data.driverName,
-                "serializedMetaData":
-                    {"speedLimit": speed_limit}
-                    if alarm_data.alarmType == 8
-                    else {"speed": float(alarm_data.gpsSpeed or 0)},
-            })
-            if alarm_data.alarmType == 8:
-                cached_alarm.update({
-                    "metricUnit": "km/h",
-                    "value": float(alarm_data.gpsSpeed or 0),
-                })
-            await send_alarms_to_gauss([cached_alarm])
-        else:
-            print(f"[WEBHOOK-ALARMS] Saving START alarm  {alarm_id} in cache.")
-            alarm_cache[alarm_id] = {
-                "start": datetime
-                .strptime(alarm_data.startTime, "%Y-%m-%dT%H:%M:%SZ")
-                .strftime("%Y-%m-%d %H:%M:%S"),
-                "latitude": float(alarm_data.gpsLat),
-                "longitude": float(alarm_data.gpsLng),
-                "altitude": float(alarm_data.gpsAltitude or 0),
-                "vehicleCode": alarm_data.vehicleNumber.split()[0],
-                "alertName": alert_name,
-                "type": alert_type,
-                "driverCode": alarm_data.driverName,
-                "serializedMetaData":
-                    {"speedLimit": speed_limit} if alarm_data.alarmType == 8
-                    else {"speed": float(alarm_data.gpsSpeed or 0)},
-            }
-            if alarm_data.alarmType == 8:
-                alarm_cache[alarm_id].update({
-                    "metricUnit": "km/h",
-                    "value": float(alarm_data.gpsSpeed or 0),
-                })
-
-    elif action == "END":
-        if alarm_id in alarm_cache and "start" in alarm_cache[alarm_id]:
-            print("[WEBHOOK-ALARMS] Found START before "
-                  f"END for alarm {alarm_id}. Sending to Gauss.")
-            cached_alarm = alarm_cache.pop(alarm_id)
-            cached_alarm["end"] = \
-                datetime.strptime(
-                    alarm_data.endTime, "%Y-%m-%dT%H:%M:%SZ"
-                    ).strftime("%Y-%m-%d %H:%M:%S")
-            await send_alarms_to_gauss([cached_alarm])
-        else:
-            print(f"[WEBHOOK-ALARMS] Saving END alarm {alarm_id} in cache "
-                  "for later processing with START.")
-            alarm_cache[alarm_id] = {
-                "end": datetime
-                .strptime(alarm_data.endTime, "%Y-%m-%dT%H:%M:%SZ")
-                .strftime("%Y-%m-%d %H:%M:%S"),
-                "latitude": float(alarm_data.gpsLat),
-                "longitude": float(alarm_data.gpsLng),
-                "altitude": float(alarm_data.gpsAltitude or 0),
-                "vehicleCode": alarm_data.vehicleNumber.split()[0],
-                "alertName": alert_name,
-                "type": alert_type,
-                "driverCode": alarm_data.driverName,
-                "serializedMetaData":
-                    {"speedLimit": speed_limit} if alarm_data.alarmType == 8
-                    else {"speed": float(alarm_data.gpsSpeed or 0)},
-            }
-            if alarm_data.alarmType == 8:
-                alarm_cache[alarm_id].update({
-                    "metricUnit": "km/h",
-                    "value": float(alarm_data.gpsSpeed or 0),
-                })
+    print(f"[WEBHOOK-ALARMS] Alarm {alarm_id} complete with {action}. "
+          "Queued for Gauss.")
+    await alarm_dispatcher.enqueue(complete_alarm)
+    return True
+
+
+async def flush_expired_alarm_pairs():
+    """
+    Send halves whose pair never arrived as single-sided alarms.
+    """
+    expired = await alarm_pairing_store.pop_expired()
+    for half in expired:
+        await alarm_dispatcher.enqueue(half)
+    if expired:
+        print(f"[WEBHOOK-ALARMS] Flushed {len(expired)} expired "
+              "half alarms as single-sided alarms.")
+
+
+async def run_alarm_pairing_sweeper():
+    """
+    Periodically flush expired alarm halves.
+    """
+    while True:
+        await asyncio.sleep(ALARM_PAIR_SWEEP_SECONDS)
+        try:
+            await flush_expired_alarm_pairs()
+        except Exception as e:
+            print(f"[WEBHOOK-ALARMS] Error flushing expired alarms: {e}")
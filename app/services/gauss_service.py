@@ -3,11 +3,16 @@ from app.utils.database import (
     gps_gauss_integration_collection,
     alarms_gauss_integration_collection
 )
+from app.utils.http_clients import get_http_client, DESTINATION_TIMEOUTS
+from app.utils.circuit_breaker import CircuitBreaker, server_error
+from app.utils.destination_limiter import DestinationLimiter
+from app.utils.token_manager import TokenManager
+from app.utils.time_utils import format_gauss_time
 from datetime import datetime, timezone
 import uuid
 import logging
 import os
-from typing import List
+from typing import List, Tuple
 
 logger = logging.getLogger("apscheduler")
 
@@ -19,9 +24,28 @@ GAUSS_PASSWORD = os.getenv("GAUSS_PASSWORD")
 GAUSS_AUTH = os.getenv("GAUSS_AUTH")
 GAUSS_INTEGRATION_ACTIVATE = \
     os.getenv("GAUSS_INTEGRATION_ACTIVATE", "false").lower() == "true"
-
-# Token cache
-gauss_token = None
+# Used when the token response does not include `expires_in`
+GAUSS_TOKEN_DEFAULT_TTL = float(os.getenv("GAUSS_TOKEN_DEFAULT_TTL", "3600"))
+# Seconds before expiry at which a background refresh starts
+GAUSS_TOKEN_REFRESH_MARGIN = \
+    float(os.getenv("GAUSS_TOKEN_REFRESH_MARGIN", "60"))
+# Requests in flight to Gauss and their start rate (0 means unlimited)
+GAUSS_MAX_CONCURRENCY = int(os.getenv("GAUSS_MAX_CONCURRENCY", "4"))
+GAUSS_RATE_LIMIT_PER_SECOND = \
+    float(os.getenv("GAUSS_RATE_LIMIT_PER_SECOND", "0"))
+
+gauss_limiter = DestinationLimiter(
+    "gauss", GAUSS_MAX_CONCURRENCY, GAUSS_RATE_LIMIT_PER_SECOND
+)
+gauss_positions_breaker = CircuitBreaker(
+    "gauss_positions", DESTINATION_TIMEOUTS["gauss"]
+)
+gauss_alarms_breaker = CircuitBreaker(
+    "gauss_alarms", DESTINATION_TIMEOUTS["gauss"]
+)
+gauss_token_breaker = CircuitBreaker(
+    "gauss_token", DESTINATION_TIMEOUTS["gauss"]
+)
 
 
 def transform_gps_data_for_gauss(gps_data: List[dict]) -> List[dict]:
@@ -37,42 +61,85 @@ def transform_gps_data_for_gauss(gps_data: List[dict]) -> List[dict]:
             "vehicleCode": data["vehicleNumber"].split()[0],
             "odometer": data.get("mileage", 0),
             "driverCode": None,
-            "start": datetime
-            .strptime(data["time"], "%Y-%m-%dT%H:%M:%SZ")
-            .strftime("%Y-%m-%d %H:%M:%S"),
+            "start": format_gauss_time(data.get("timeAt") or data["time"]),
             "speed": data["speed"],
         })
     return transformed
 
 
-async def fetch_gauss_token() -> str:
+async def fetch_gauss_token() -> Tuple[str, float]:
     """
     Fetch a new access token from Gauss API.
+    Returns the token and its lifetime in seconds.
     """
-    global gauss_token
     try:
         logger.info("[GAUSS API] Fetching token...")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                GAUSS_TOKEN_URL,
-                headers={
-                    "Authorization": f"Basic {GAUSS_AUTH}"
-                },
-                data={
-                    "username": GAUSS_USERNAME,
-                    "password": GAUSS_PASSWORD,
-                    "grant_type": "password"
-                },
-                timeout=30
+        client = get_http_client("gauss")
+        response = await gauss_limiter.run(
+            lambda: gauss_token_breaker.call(
+                lambda timeout: client.post(
+                    GAUSS_TOKEN_URL,
+                    headers={
+                        "Authorization": f"Basic {GAUSS_AUTH}"
+                    },
+                    data={
+                        "username": GAUSS_USERNAME,
+                        "password": GAUSS_PASSWORD,
+                        "grant_type": "password"
+                    },
+                    timeout=timeout
+                ),
+                server_error
             )
-            gauss_token = response.json().get("access_token")
-            logger.info("[GAUSS API] Token fetched successfully.")
-            return gauss_token
+        )
+        response.raise_for_status()
+        token_data = response.json()
+        logger.info("[GAUSS API] Token fetched successfully.")
+        return (
+            token_data["access_token"],
+            token_data.get("expires_in") or GAUSS_TOKEN_DEFAULT_TTL
+        )
     except Exception as e:
         logger.error(f"[GAUSS API] Error fetching token: {e}")
         raise
 
 
+gauss_token_manager = TokenManager(
+    "GAUSS", fetch_gauss_token, GAUSS_TOKEN_REFRESH_MARGIN
+)
+
+
+async def post_to_gauss(url: str, payload: list,
+                        breaker: CircuitBreaker) -> httpx.Response:
+    """
+    Post a payload to Gauss with the cached token, through the Gauss
+    limiter and `breaker`.
+    On a 401 the token is refreshed and the request is retried once.
+    """
+    client = get_http_client("gauss")
+    for attempt in range(2):
+        token = await gauss_token_manager.get_token()
+        response = await gauss_limiter.run(
+            lambda: breaker.call(
+                lambda timeout: client.post(
+                    url,
+                    json=payload,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Authorization": f"Bearer {token}"
+                    },
+                    timeout=timeout
+                ),
+                server_error
+            )
+        )
+        if response.status_code != 401 or attempt == 1:
+            return response
+        logger.warning("[GAUSS API] Token rejected. Fetching a new one.")
+        gauss_token_manager.invalidate(token)
+    return response
+
+
 async def send_gps_data_to_gauss_control(gps_data: list) -> bool:
     """
     Send GPS data to Gauss Control API.
@@ -88,59 +155,39 @@ async def send_gps_data_to_gauss_control(gps_data: list) -> bool:
             )
             return True
 
-        # Ensure token is available
-        if not gauss_token:
-            await fetch_gauss_token()
-
-        async with httpx.AsyncClient() as client:
-            logger.info("[GAUSS GPS API] Sending GPS data.")
-            response = await client.post(
-                GAUSS_POSITION_UPDATE_URL,
-                json=transformed_data,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {gauss_token}"
-                },
-                timeout=30
-            )
-            response_data = response.json()
-            if response.status_code != 200:
-                await log_gauss_integration(
-                    gps_gauss_integration_collection,
-                    payload_id, transformed_data, response_data, "failed"
-                )
-                logger.error("[GAUSS GPS API] Failed to send data "
-                             f"for payload:  {payload_id}")
-                return False
-            else:
-                await log_gauss_integration(
-                    gps_gauss_integration_collection,
-                    payload_id, transformed_data, response_data, "success"
-                )
-                logger.info("[GAUSS GPS API] Data sent successfully "
-                            f"for payload: {payload_id}")
-
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == 401:  # Token expired
-            logger.warning("[GAUSS GPS API] Token expired. "
-                           "Fetching a new one.")
-            await fetch_gauss_token()
-            return await send_gps_data_to_gauss_control(gps_data)
-        await log_gauss_integration(
-            gps_gauss_integration_collection,
-            payload_id, gps_data, None, "failed", str(e)
+        logger.info("[GAUSS GPS API] Sending GPS data.")
+        response = await post_to_gauss(
+            GAUSS_POSITION_UPDATE_URL, transformed_data,
+            gauss_positions_breaker
         )
-        logger.error(f"[GAUSS GPS API] HTTP error: {e}")
+        response_data = response.json()
+        if response.status_code != 200:
+            await log_gauss_integration(
+                gps_gauss_integration_collection,
+                payload_id, transformed_data, response_data, "failed"
+            )
+            logger.error("[GAUSS GPS API] Failed to send data "
+                         f"for payload:  {payload_id}")
+            return False
+        else:
+            await log_gauss_integration(
+                gps_gauss_integration_collection,
+                payload_id, transformed_data, response_data, "success"
+            )
+            logger.info("[GAUSS GPS API] Data sent successfully "
+                        f"for payload: {payload_id}")
+
     except Exception as e:
         await log_gauss_integration(
             gps_gauss_integration_collection,
             payload_id, gps_data, None, "failed", str(e)
         )
         logger.error(f"[GAUSS GPS API] Exception while sending data: {e}")
+        return False
     return True
 
 
-async def send_alarms_to_gauss(alarms: List[dict]):
+async def send_alarms_to_gauss(alarms: List[dict]) -> bool:
     """
     Send alarms to Gauss Control API.
     """
@@ -153,45 +200,34 @@ async def send_alarms_to_gauss(alarms: List[dict]):
                 payload_id, alarms, None, "not_activated"
             )
             return True
-        if not gauss_token:
-            await fetch_gauss_token()
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                GAUSS_ALARM_URL,
-                json=alarms,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {gauss_token}"
-                },
-                timeout=30
+        response = await post_to_gauss(
+            GAUSS_ALARM_URL, alarms, gauss_alarms_breaker
+        )
+        response_data = response.json()
+        if response.status_code != 200:
+            await log_gauss_integration(
+                alarms_gauss_integration_collection,
+                payload_id, alarms, response_data, "failed"
+            )
+            logger.error("[GAUSS API] Failed to send alarms: "
+                         f"{response_data}")
+            return False
+        else:
+            await log_gauss_integration(
+                alarms_gauss_integration_collection,
+                payload_id, alarms, response_data, "success"
             )
-            response_data = response.json()
-            if response.status_code != 200:
-                await log_gauss_integration(
-                    alarms_gauss_integration_collection,
-                    payload_id, alarms, response_data, "failed"
-                )
-                logger.error("[GAUSS API] Failed to send alarms: "
-                             f"{response_data}")
-                return False
-            else:
-                await log_gauss_integration(
-                    alarms_gauss_integration_collection,
-                    payload_id, alarms, response_data, "success"
-                )
-                logger.info("[GAUSS API] Alarms sent successfully: "
-                            f"{response_data}")
-                return True
-
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == 401:  # Token expired
-            logger.warning("[GAUSS API] Token expired. Fetching a new one.")
-            await fetch_gauss_token()
-            return await send_alarms_to_gauss(alarms)
-        logger.error(f"[GAUSS API] HTTP error: {e}")
+            logger.info("[GAUSS API] Alarms sent successfully: "
+                        f"{response_data}")
+            return True
+
     except Exception as e:
+        await log_gauss_integration(
+            alarms_gauss_integration_collection,
+            payload_id, alarms, None, "failed", str(e)
+        )
         logger.error(f"[GAUSS API] Exception while sending alarms: {e}")
+        return False
 
 
 async def log_gauss_integration(
@@ -1,52 +1,433 @@
-from app.utils.database import gps_collection, gps_payload_collection
+from app.utils.database import (
+    gps_collection,
+    gps_payload_collection,
+    gps_history_collection,
+    gps_positions_ts_collection,
+    GPS_STORAGE_BACKEND
+)
 from app.models.gps_data import GPSPayload
+from app.utils.ingest_buffer import IngestBuffer
+from app.utils.dedup import RecentIdFilter, insert_many_ignoring_duplicates
+from app.utils.track_simplify import simplify_track
+from app.utils.time_utils import parse_iso_time, parse_iso_time_or_none, as_utc
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import binascii
+import csv
+import io
+import json
+import zlib
 import uuid
 import os
-from datetime import datetime, timezone
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 LOG_GPS_PAYLOAD = os.getenv("LOG_GPS_PAYLOAD", "false").lower() == 'true'
 LOG_GPS_DATA = os.getenv("LOG_GPS_DATA", "false").lower() == 'true'
+# One document per position, used by the history endpoint when enabled
+LOG_GPS_HISTORY = os.getenv("LOG_GPS_HISTORY", "false").lower() == 'true'
+# History pages are served with a cursor from the per-position stores
+GPS_HISTORY_PAGED = LOG_GPS_HISTORY or GPS_STORAGE_BACKEND == "timeseries"
+
+EXPORT_CURSOR_BATCH_SIZE = int(os.getenv("EXPORT_CURSOR_BATCH_SIZE", "5000"))
+# Window read by the batch endpoint for several positions per vehicle
+# when no `start_time` is given
+GPS_BATCH_WINDOW_HOURS = float(os.getenv("GPS_BATCH_WINDOW_HOURS", "24"))
+# Rows are compressed in blocks of roughly this many bytes
+EXPORT_FLUSH_BYTES = 64 * 1024
+EXPORT_FIELDS = [
+    "vehicleNumber", "time", "lat", "lng", "speed",
+    "angle", "altitude", "mileage"
+]
+
+# "direct" writes on each request, "buffered" group-commits many requests
+GPS_INGEST_MODE = os.getenv("GPS_INGEST_MODE", "direct").lower()
+INGEST_FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "1000"))
+INGEST_FLUSH_INTERVAL_MS = float(os.getenv("INGEST_FLUSH_INTERVAL_MS", "5"))
+INGEST_BUFFER_CAPACITY = int(os.getenv("INGEST_BUFFER_CAPACITY", "1000"))
+# When true the webhook waits until its documents are written
+INGEST_WAIT_FOR_FLUSH = \
+    os.getenv("INGEST_WAIT_FOR_FLUSH", "true").lower() == 'true'
+
+# Recently stored position ids, to drop webhook retries early. 0 disables it.
+# Unused with buffered ingest that does not wait for the flush
+GPS_DEDUP_CACHE_SIZE = int(os.getenv("GPS_DEDUP_CACHE_SIZE", "100000"))
+
+recent_position_ids = RecentIdFilter(GPS_DEDUP_CACHE_SIZE)
+
+# Only vehicles that reported within this window are restored at startup
+LATEST_POSITIONS_REBUILD_HOURS = \
+    float(os.getenv("LATEST_POSITIONS_REBUILD_HOURS", "24"))
+# Restore the latest position table at startup when a position store is
+# enabled, so /gps/latest survives a restart
+LATEST_POSITIONS_REBUILD = \
+    os.getenv("LATEST_POSITIONS_REBUILD", "true").lower() == 'true' and \
+    (LOG_GPS_DATA or GPS_STORAGE_BACKEND == "timeseries")
+
+# Called with the number of new positions after each stored batch
+ingest_listeners: List[Callable[[int], None]] = []
+
+gps_ingest_buffer = IngestBuffer(
+    "GPSData", gps_collection,
+    INGEST_FLUSH_SIZE, INGEST_FLUSH_INTERVAL_MS / 1000, INGEST_BUFFER_CAPACITY
+)
+gps_payload_ingest_buffer = IngestBuffer(
+    "GPSPayload", gps_payload_collection,
+    INGEST_FLUSH_SIZE, INGEST_FLUSH_INTERVAL_MS / 1000, INGEST_BUFFER_CAPACITY
+)
+gps_history_ingest_buffer = IngestBuffer(
+    "GPSHistory", gps_history_collection,
+    INGEST_FLUSH_SIZE, INGEST_FLUSH_INTERVAL_MS / 1000, INGEST_BUFFER_CAPACITY
+)
+# `receivedAt` is stamped at flush time, the time-series dispatch
+# checkpoints advance over it
+gps_timeseries_ingest_buffer = IngestBuffer(
+    "GPSTimeSeries", gps_positions_ts_collection,
+    INGEST_FLUSH_SIZE, INGEST_FLUSH_INTERVAL_MS / 1000, INGEST_BUFFER_CAPACITY,
+    stamp_field="receivedAt"
+)
+
+
+class LatestPosition:
+    """
+    Last known position of a vehicle.
+    """
+    __slots__ = (
+        "vehicleNumber", "lat", "lng", "speed", "angle", "altitude",
+        "mileage", "time", "timeAt", "receivedAt", "pendingGauss"
+    )
+
+    def __init__(self, record: dict, received_at: datetime,
+                 pending_gauss: bool = True):
+        self.vehicleNumber = record["vehicleNumber"]
+        self.lat = record.get("lat")
+        self.lng = record.get("lng")
+        self.speed = record.get("speed")
+        self.angle = record.get("angle")
+        self.altitude = record.get("altitude")
+        self.mileage = record.get("mileage")
+        self.time = record.get("time")
+        self.timeAt = as_utc(record.get("timeAt"))
+        self.receivedAt = received_at
+        self.pendingGauss = pending_gauss
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+# Last known position per vehicle, keyed by vehicle number
+latest_positions: Dict[str, LatestPosition] = {}
+
+
+def update_latest_positions(records: List[dict], received_at: datetime):
+    """
+    Keep the newest position per vehicle from an incoming batch.
+    """
+    for record in records:
+        vehicle_number = record.get("vehicleNumber")
+        if not vehicle_number or not record.get("timeAt"):
+            continue
+        current = latest_positions.get(vehicle_number)
+        if current is None or as_utc(record["timeAt"]) > current.timeAt:
+            latest_positions[vehicle_number] = \
+                LatestPosition(record, received_at)
+
+
+def get_latest_positions() -> List[dict]:
+    """
+    Get the last known position of every vehicle.
+    """
+    return [position.to_dict() for position in latest_positions.values()]
+
+
+async def rebuild_latest_positions():
+    """
+    Rebuild the latest position table from MongoDB after a restart.
+    Only positions of the last `LATEST_POSITIONS_REBUILD_HOURS` are read,
+    along the vehicle/time index.
+    """
+    if GPS_STORAGE_BACKEND == "timeseries":
+        collection = gps_positions_ts_collection
+        vehicle_key, time_key = "vehicle.vehicleNumber", "timestamp"
+    else:
+        collection = gps_collection
+        vehicle_key, time_key = "vehicleNumber", "timeAt"
+    vehicle_field = f"${vehicle_key}"
+    time_at_field = f"${time_key}"
+    since = datetime.now(timezone.utc) - \
+        timedelta(hours=LATEST_POSITIONS_REBUILD_HOURS)
+
+    cursor = collection.aggregate([
+        {"$match": {time_key: {"$gte": since}}},
+        {"$sort": {vehicle_key: 1, time_key: -1}},
+        {"$group": {
+            "_id": vehicle_field,
+            "vehicleNumber": {"$first": vehicle_field},
+            "lat": {"$first": "$lat"},
+            "lng": {"$first": "$lng"},
+            "speed": {"$first": "$speed"},
+            "angle": {"$first": "$angle"},
+            "altitude": {"$first": "$altitude"},
+            "mileage": {"$first": "$mileage"},
+            "time": {"$first": "$time"},
+            "timeAt": {"$first": time_at_field},
+            "receivedAt": {"$first": "$receivedAt"},
+            "sentToGaussControl": {"$first": "$sentToGaussControl"},
+        }}
+    ], allowDiskUse=True)
+    latest_positions.clear()
+    async for record in cursor:
+        if not record.get("vehicleNumber") or not record.get("timeAt"):
+            continue
+        latest_positions[record["vehicleNumber"]] = LatestPosition(
+            record, record.get("receivedAt"),
+            pending_gauss=not record.get("sentToGaussControl", False)
+        )
+    print("[GPSData] Latest positions rebuilt for "
+          f"{len(latest_positions)} vehicles.")
 
 
 async def process_gps_data(payload: GPSPayload):
     try:
         payload_id = str(uuid.uuid4())
         received_at = datetime.now(timezone.utc)
-        if LOG_GPS_DATA:
+        records = [gps_data.dict() for gps_data in payload.data]
+        # Parse times once, stored as BSON dates next to the strings
+        for record in records:
+            record["timeAt"] = parse_iso_time_or_none(record["time"])
+        # Positions already stored are dropped. The unique index on `id`
+        # catches the ones this process did not see
+        new_records = recent_position_ids.take_new(records)
+        duplicates = len(records) - len(new_records)
+        if duplicates:
+            print(f"[GPSData] Skipped {duplicates} repeated positions.")
+        update_latest_positions(new_records, received_at)
+        if GPS_STORAGE_BACKEND == "timeseries":
+            await store_gps_timeseries(
+                new_records, payload.time, payload_id, received_at
+            )
+        elif LOG_GPS_DATA:
             documents = [
                 {
-                    **gps_data.dict(),
+                    **record,
                     "payloadId": payload_id,
                     "receivedAt": received_at,
                     "sentToMigtra": False,
                     "sentToGaussControl": False
                 }
-                for gps_data in payload.data
+                for record in new_records
             ]
-            if documents:
-                await gps_collection.insert_many(documents)
+            if documents and GPS_INGEST_MODE == "buffered":
+                await gps_ingest_buffer.put(documents, INGEST_WAIT_FOR_FLUSH)
+            elif documents:
+                await insert_many_ignoring_duplicates(
+                    gps_collection, documents
+                )
                 print("[GPSData DB] Saved GPS data for "
                       f"{len(documents)} vehicles.")
 
+        if LOG_GPS_HISTORY and GPS_STORAGE_BACKEND != "timeseries":
+            history = [
+                {
+                    "id": record["id"],
+                    "vehicleNumber": record["vehicleNumber"],
+                    "time": record["time"],
+                    "timeAt": record["timeAt"],
+                    "docTime": payload.time,
+                    "receivedAt": received_at,
+                    "payloadId": payload_id,
+                    "lat": record["lat"],
+                    "lng": record["lng"],
+                    "speed": record["speed"],
+                    "angle": record["angle"],
+                    "altitude": record["altitude"],
+                }
+                for record in new_records
+                if record.get("vehicleNumber")
+            ]
+            if history and GPS_INGEST_MODE == "buffered":
+                await gps_history_ingest_buffer.put(
+                    history, INGEST_WAIT_FOR_FLUSH
+                )
+            elif history:
+                await insert_many_ignoring_duplicates(
+                    gps_history_collection, history
+                )
+                print("[GPSHistory DB] Saved GPS history for "
+                      f"{len(history)} positions.")
+
         if LOG_GPS_PAYLOAD:
             payload_doc = {
                 "payloadId": payload_id,
                 "tenantId": payload.tenantId,
                 "type": payload.type,
                 "time": payload.time,
+                "timeAt": parse_iso_time_or_none(payload.time),
                 "receivedAt": received_at,
                 "dataCount": len(payload.data),
-                "data": [gps_data.dict() for gps_data in payload.data]
+                "data": records
             }
-            await gps_payload_collection.insert_one(payload_doc)
-            print("[GPSPayload DB] Saved entire GPS payload document.")
+            if GPS_INGEST_MODE == "buffered":
+                await gps_payload_ingest_buffer.put(
+                    [payload_doc], INGEST_WAIT_FOR_FLUSH
+                )
+            else:
+                await gps_payload_collection.insert_one(payload_doc)
+                print("[GPSPayload DB] Saved entire GPS payload document.")
 
-        return {"status": "success", "message": "GPS data stored successfully"}
+        # Ids are only marked once their write is confirmed. Unawaited
+        # buffered writes may still fail, so their retries must get through
+        if GPS_INGEST_MODE != "buffered" or INGEST_WAIT_FOR_FLUSH:
+            recent_position_ids.mark_seen(
+                record["id"] for record in new_records
+            )
+        for listener in ingest_listeners:
+            listener(len(new_records))
+        return {
+            "status": "success",
+            "message": "GPS data stored successfully",
+            "payloadId": payload_id,
+            "duplicates": duplicates
+        }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
+async def store_gps_timeseries(
+        records: List[dict], batch_time: str,
+        payload_id: str, received_at: datetime):
+    """
+    Store positions in the time-series collection, one measurement per
+    position with the vehicle as metadata.
+    """
+    measurements = []
+    for record in records:
+        if not record.get("vehicleNumber"):
+            continue
+        timestamp = record["timeAt"] or received_at
+        measurement = {
+            field: value for field, value in record.items()
+            if field not in ("vehicleNumber", "timeAt")
+        }
+        measurements.append({
+            **measurement,
+            "timestamp": timestamp,
+            "vehicle": {"vehicleNumber": record["vehicleNumber"]},
+            "docTime": batch_time,
+            "payloadId": payload_id,
+            "receivedAt": received_at,
+        })
+    if not measurements:
+        return
+    if GPS_INGEST_MODE == "buffered":
+        await gps_timeseries_ingest_buffer.put(
+            measurements, INGEST_WAIT_FOR_FLUSH
+        )
+    else:
+        await gps_positions_ts_collection.insert_many(
+            measurements, ordered=False
+        )
+        print("[GPSTimeSeries DB] Saved GPS positions for "
+              f"{len(measurements)} vehicles.")
+
+
+def start_ingest_buffers():
+    """
+    Start the background writers of the GPS ingest buffers.
+    """
+    if GPS_INGEST_MODE == "buffered":
+        gps_ingest_buffer.start()
+        gps_payload_ingest_buffer.start()
+        gps_history_ingest_buffer.start()
+        gps_timeseries_ingest_buffer.start()
+
+
+async def stop_ingest_buffers():
+    """
+    Flush pending GPS documents and stop the writers.
+    """
+    await gps_ingest_buffer.stop()
+    await gps_payload_ingest_buffer.stop()
+    await gps_history_ingest_buffer.stop()
+    await gps_timeseries_ingest_buffer.stop()
+
+
+def encode_history_cursor(document: dict) -> str:
+    """
+    Build the opaque cursor pointing after `document`.
+    """
+    cursor_time = document["cursorTime"]
+    if isinstance(cursor_time, datetime):
+        cursor_time = cursor_time.isoformat()
+    raw = json.dumps({"t": cursor_time, "id": str(document["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_history_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return raw["t"], ObjectId(raw["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("`cursor` inválido")
+
+
+async def get_gps_history_page(
+        vehicleNumber: str,
+        start_time: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Get a page of GPS positions for a vehicle from the history collection
+    (or the time-series collection), newest first. Uses keyset pagination
+    so every page costs the same.
+    Returns the page and the cursor of the next page, if any.
+    """
+    if GPS_STORAGE_BACKEND == "timeseries":
+        collection = gps_positions_ts_collection
+        vehicle_field, time_field = "vehicle.vehicleNumber", "timestamp"
+    else:
+        collection = gps_history_collection
+        vehicle_field, time_field = "vehicleNumber", "timeAt"
+
+    query = {vehicle_field: vehicleNumber}
+    if start_time:
+        try:
+            query[time_field] = {"$gt": parse_iso_time(start_time)}
+        except ValueError:
+            raise ValueError(
+                "`start_time` debe estar en formato ISO 8601, "
+                "por ejemplo '2024-12-24T21:00:00Z'"
+            )
+    if cursor:
+        cursor_time, cursor_id = decode_history_cursor(cursor)
+        cursor_time = parse_iso_time(cursor_time)
+        query["$or"] = [
+            {time_field: {"$lt": cursor_time}},
+            {time_field: cursor_time, "_id": {"$lt": cursor_id}}
+        ]
+
+    documents = await collection.find(
+        query,
+        {
+            "docTime": 1,
+            "receivedAt": 1,
+            "vehicleNumber": f"${vehicle_field}",
+            "lat": 1,
+            "lng": 1,
+            "speed": 1,
+            "positionTime": "$time",
+            "cursorTime": f"${time_field}",
+        }
+    ).sort([(time_field, -1), ("_id", -1)]).limit(limit + 1).to_list(None)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_history_cursor(documents[-1])
+    return documents, next_cursor
+
+
 async def get_gps_data_by_vehicle(
         vehicleNumber: str,
         start_time: Optional[str] = None,
@@ -62,7 +443,7 @@ async def get_gps_data_by_vehicle(
 
     if start_time:
         try:
-            match_filter['time'] = {'$gt': start_time}
+            match_filter['timeAt'] = {'$gt': parse_iso_time(start_time)}
         except ValueError:
             raise ValueError(
                 "`start_time` debe estar en formato ISO 8601, "
@@ -83,7 +464,7 @@ async def get_gps_data_by_vehicle(
         },
         {
             '$sort': {
-                'time': -1
+                'timeAt': -1
             }
         },
         {
@@ -112,3 +493,187 @@ async def get_gps_data_by_vehicle(
         results.append(document)
 
     return results
+
+
+def position_store() -> Tuple[object, str, str]:
+    """
+    Per-position store in use for bulk reads.
+    Returns the collection, vehicle field and datetime field.
+    """
+    if GPS_STORAGE_BACKEND == "timeseries":
+        return (gps_positions_ts_collection,
+                "vehicle.vehicleNumber", "timestamp")
+    if LOG_GPS_HISTORY:
+        return gps_history_collection, "vehicleNumber", "timeAt"
+    return gps_collection, "vehicleNumber", "timeAt"
+
+
+async def get_gps_data_by_vehicles(
+        vehicles: List[str],
+        start_time: Optional[str] = None,
+        limit_per_vehicle: int = 1) -> Dict[str, List[dict]]:
+    """
+    Get the latest positions of several vehicles in one query, newest
+    first, grouped by vehicle number. Without `start_time`, several
+    positions per vehicle are read from the last
+    `GPS_BATCH_WINDOW_HOURS` only.
+    """
+    collection, vehicle_field, time_field = position_store()
+    match_filter = {vehicle_field: {"$in": vehicles}}
+    try:
+        since = parse_iso_time(start_time)
+    except ValueError:
+        raise ValueError(
+            "`start_time` debe estar en formato ISO 8601, "
+            "por ejemplo '2024-12-24T21:00:00Z'"
+        )
+    if since is None and limit_per_vehicle > 1:
+        since = datetime.now(timezone.utc) - \
+            timedelta(hours=GPS_BATCH_WINDOW_HOURS)
+    if since is not None:
+        match_filter[time_field] = {"$gt": since}
+
+    output = {
+        "lat": "$lat",
+        "lng": "$lng",
+        "speed": "$speed",
+        "angle": "$angle",
+        "altitude": "$altitude",
+        "time": "$time",
+        "receivedAt": "$receivedAt",
+    }
+    if limit_per_vehicle == 1:
+        # Sorted like the vehicle/time index, the group reads a single
+        # position per vehicle (DISTINCT_SCAN) instead of the whole history
+        pipeline = [
+            {"$match": match_filter},
+            {"$sort": {vehicle_field: 1, time_field: -1}},
+            {"$group": {
+                "_id": f"${vehicle_field}",
+                **{field: {"$first": value}
+                   for field, value in output.items()}
+            }},
+            {"$project": {
+                "positions": [{field: f"${field}" for field in output}]
+            }}
+        ]
+    else:
+        pipeline = [
+            {"$match": match_filter},
+            {"$group": {
+                "_id": f"${vehicle_field}",
+                "positions": {"$topN": {
+                    "n": limit_per_vehicle,
+                    "sortBy": {time_field: -1},
+                    "output": output
+                }}
+            }}
+        ]
+
+    cursor = collection.aggregate(pipeline)
+    results = {vehicle: [] for vehicle in vehicles}
+    async for document in cursor:
+        results[document["_id"]] = document["positions"]
+    return results
+
+
+def build_gps_export_query(
+        start_time: str,
+        end_time: Optional[str] = None,
+        vehicles: Optional[List[str]] = None) -> tuple:
+    """
+    Build the export query over the per-position store in use.
+    Returns the collection, filter, sort and projection.
+    Raises ValueError for invalid times.
+    """
+    try:
+        start = parse_iso_time(start_time)
+        end = parse_iso_time(end_time) or datetime.now(timezone.utc)
+    except ValueError:
+        raise ValueError(
+            "`start_time` y `end_time` deben estar en formato ISO 8601, "
+            "por ejemplo '2024-12-24T21:00:00Z'"
+        )
+    if start is None or start >= end:
+        raise ValueError("`start_time` debe ser anterior a `end_time`")
+
+    collection, vehicle_field, time_field = position_store()
+    query = {time_field: {"$gte": start, "$lt": end}}
+    if vehicles:
+        query[vehicle_field] = {"$in": vehicles}
+    projection = {field: 1 for field in EXPORT_FIELDS}
+    projection["_id"] = 0
+    projection["vehicleNumber"] = f"${vehicle_field}"
+    # The (vehicle, 1), (time, -1) indexes walked backwards give this order,
+    # so rows stream without an in-memory sort
+    sort = [(vehicle_field, -1), (time_field, 1)]
+    return collection, query, sort, projection
+
+
+async def stream_gps_export(
+        collection, query: dict, sort: list, projection: dict,
+        export_format: str = "ndjson",
+        compress: bool = True,
+        simplify: Optional[str] = None,
+        tolerance_m: float = 10,
+        bucket_seconds: int = 60) -> AsyncIterator[bytes]:
+    """
+    Stream GPS positions as NDJSON or CSV straight from a cursor, optionally
+    gzip-compressed. Only one block of rows is held in memory at a time.
+    With `simplify`, the track of one vehicle is held and simplified before
+    it is written.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = None
+    if export_format == "csv":
+        writer = csv.DictWriter(
+            buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore"
+        )
+        writer.writeheader()
+
+    def take_block() -> bytes:
+        block = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(block) if compressor else block
+
+    def write_rows(documents: List[dict]):
+        if simplify:
+            documents = simplify_track(
+                documents, simplify, tolerance_m, bucket_seconds
+            )
+        for document in documents:
+            if writer:
+                writer.writerow(document)
+            else:
+                buffer.write(json.dumps(document))
+                buffer.write("\n")
+
+    # Rows are sorted by vehicle, so each track is contiguous
+    track = []
+    cursor = collection.find(query, projection) \
+        .sort(sort).batch_size(EXPORT_CURSOR_BATCH_SIZE)
+    try:
+        async for document in cursor:
+            if not simplify:
+                write_rows([document])
+            elif track and \
+                    track[-1]["vehicleNumber"] != document["vehicleNumber"]:
+                write_rows(track)
+                track = [document]
+            else:
+                track.append(document)
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                block = take_block()
+                if block:
+                    yield block
+    finally:
+        await cursor.close()
+
+    write_rows(track)
+    block = take_block()
+    if compressor:
+        block += compressor.flush()
+    if block:
+        yield block
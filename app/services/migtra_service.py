@@ -1,5 +1,8 @@
-import httpx
 from app.utils.database import gps_migtra_integration_collection
+from app.utils.http_clients import get_http_client, DESTINATION_TIMEOUTS
+from app.utils.circuit_breaker import CircuitBreaker, server_error
+from app.utils.destination_limiter import DestinationLimiter
+from app.utils.retry_queue import dispatch_retry_queue
 from datetime import datetime, timezone
 import uuid
 import logging
@@ -13,6 +16,15 @@ MIGTRA_USERNAME = os.getenv("MIGTRA_USERNAME")
 MIGTRA_PASSWORD = os.getenv("MIGTRA_PASSWORD")
 MIGTRA_INTEGRATION_ACTIVATE = \
     os.getenv("MIGTRA_INTEGRATION_ACTIVATE", "false").lower() == 'true'
+# Requests in flight to Migtra and their start rate (0 means unlimited)
+MIGTRA_MAX_CONCURRENCY = int(os.getenv("MIGTRA_MAX_CONCURRENCY", "4"))
+MIGTRA_RATE_LIMIT_PER_SECOND = \
+    float(os.getenv("MIGTRA_RATE_LIMIT_PER_SECOND", "0"))
+
+migtra_limiter = DestinationLimiter(
+    "migtra", MIGTRA_MAX_CONCURRENCY, MIGTRA_RATE_LIMIT_PER_SECOND
+)
+migtra_breaker = CircuitBreaker("migtra", DESTINATION_TIMEOUTS["migtra"])
 
 
 async def send_gps_data_to_migtra(gps_data: List[dict]) -> bool:
@@ -31,15 +43,20 @@ async def send_gps_data_to_migtra(gps_data: List[dict]) -> bool:
                 payload_id, transformed_data, None, "not_activated"
             )
             return True
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                MIGTRA_URL,
-                json=transformed_data,
-                headers={"Content-Type": "application/json"},
-                auth=(MIGTRA_USERNAME, MIGTRA_PASSWORD),
-                timeout=30
+        client = get_http_client("migtra")
+        response = await migtra_limiter.run(
+            lambda: migtra_breaker.call(
+                lambda timeout: client.post(
+                    MIGTRA_URL,
+                    json=transformed_data,
+                    headers={"Content-Type": "application/json"},
+                    auth=(MIGTRA_USERNAME, MIGTRA_PASSWORD),
+                    timeout=timeout
+                ),
+                server_error
             )
-            logger.info(f"[MIGTRA API] Response: {response.json()}")
+        )
+        logger.info(f"[MIGTRA API] Response: {response.json()}")
 
         response_data = response.json()
         if response.status_code == 200:
@@ -66,6 +83,12 @@ async def send_gps_data_to_migtra(gps_data: List[dict]) -> bool:
     return True
 
 
+# Used by the dispatch jobs: failed batches go to the retry queue when enabled
+send_gps_data_to_migtra_or_retry = dispatch_retry_queue.wrap(
+    "migtra", send_gps_data_to_migtra
+)
+
+
 def transform_gps_data_for_migtra(
         gps_data: List[dict]) -> List[dict]:
     """
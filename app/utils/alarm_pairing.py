@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import logging
+import time
+from typing import List, Optional
+
+logger = logging.getLogger("apscheduler")
+
+# Field holding each half of a pair, by alarm action
+HALF_FIELDS = {"START": "startAlarm", "END": "endAlarm"}
+
+
+def merge_halves(start_half: dict, end_half: dict) -> dict:
+    """
+    Merge both halves of an alarm. START data wins, END adds the end time.
+    """
+    return {**end_half, **start_half}
+
+
+class MemoryAlarmPairingStore:
+    """
+    Process-local pairing store with TTL eviction and an LRU memory cap.
+    Halves evicted by the cap are kept aside and returned by `pop_expired`
+    so they can be flushed as single-sided alarms.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pairs: "OrderedDict[str, tuple]" = OrderedDict()
+        self._evicted: List[dict] = []
+
+    async def merge(self, alarm_id: str, action: str,
+                    half: dict) -> Optional[dict]:
+        """
+        Store a half. Returns the complete alarm when the other half is
+        already stored, otherwise None.
+        """
+        cached = self._pairs.get(alarm_id)
+        if cached is not None and cached[1] != action:
+            del self._pairs[alarm_id]
+            other = cached[2]
+            if action == "START":
+                return merge_halves(half, other)
+            return merge_halves(other, half)
+
+        self._pairs[alarm_id] = (time.monotonic(), action, half)
+        self._pairs.move_to_end(alarm_id)
+        while len(self._pairs) > self.max_entries:
+            evicted_id, (_, _, evicted_half) = \
+                self._pairs.popitem(last=False)
+            logger.warning("[ALARM PAIRING] Memory cap reached. "
+                           f"Evicting alarm {evicted_id}.")
+            self._evicted.append(evicted_half)
+        return None
+
+    async def pop_expired(self) -> List[dict]:
+        """
+        Remove and return halves older than the TTL or evicted by the cap.
+        """
+        expired, self._evicted = self._evicted, []
+        limit = time.monotonic() - self.ttl
+        # Entries are kept in insertion order, oldest first
+        while self._pairs:
+            alarm_id, (stored_at, _, half) = next(iter(self._pairs.items()))
+            if stored_at > limit:
+                break
+            del self._pairs[alarm_id]
+            expired.append(half)
+        return expired
+
+    def size(self) -> int:
+        return len(self._pairs)
+
+
+class MongoAlarmPairingStore:
+    """
+    Pairing store shared by every worker through a MongoDB collection.
+    Each half is stored with an atomic upsert keyed by alarmId and the
+    complete pair is claimed with find_one_and_delete, so it is sent once.
+    """
+
+    def __init__(self, collection, ttl: float):
+        self.collection = collection
+        self.ttl = ttl
+
+    async def merge(self, alarm_id: str, action: str,
+                    half: dict) -> Optional[dict]:
+        await self.collection.update_one(
+            {"_id": alarm_id},
+            {"$set": {
+                HALF_FIELDS[action]: half,
+                "updatedAt": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+        pair = await self.collection.find_one_and_delete({
+            "_id": alarm_id,
+            "startAlarm": {"$exists": True},
+            "endAlarm": {"$exists": True}
+        })
+        if pair is None:
+            return None
+        return merge_halves(pair["startAlarm"], pair["endAlarm"])
+
+    async def pop_expired(self) -> List[dict]:
+        limit = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        expired = []
+        cursor = self.collection.find(
+            {"updatedAt": {"$lt": limit}}, {"_id": 1}
+        )
+        async for document in cursor:
+            pair = await self.collection.find_one_and_delete({
+                "_id": document["_id"],
+                "updatedAt": {"$lt": limit}
+            })
+            if pair is None:
+                continue
+            half = pair.get("startAlarm") or pair.get("endAlarm")
+            if half:
+                expired.append(half)
+        return expired
+
+    def size(self) -> Optional[int]:
+        return None
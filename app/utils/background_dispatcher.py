@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("apscheduler")
+
+
+class BackgroundDispatcher:
+    """
+    Deliver queued items with a pool of background workers so the caller
+    only waits for the enqueue.
+
+    Items are grouped into batches of at most `max_batch` items, waiting at
+    most `linger` seconds after the first item of a batch. `handler` receives
+    the batch as a list and returns a truthy value when it was delivered.
+    """
+
+    def __init__(self, name: str,
+                 handler: Callable[[List[Any]], Awaitable[Any]],
+                 workers: int = 4, capacity: int = 10000,
+                 max_batch: int = 1, linger: float = 0):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.capacity = capacity
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue: Optional[asyncio.Queue] = None
+        self._batches: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._in_flight = 0
+        self._delivered = 0
+        self._failed = 0
+        self._batches_sent = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.capacity)
+        self._batches = asyncio.Queue(maxsize=self.workers)
+        self._tasks = [asyncio.create_task(self._collector())] + [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+        logger.info(f"[DISPATCHER {self.name}] Started "
+                    f"{self.workers} workers.")
+
+    async def stop(self, timeout: float = 10):
+        """
+        Give pending items `timeout` seconds to be delivered, then stop.
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[DISPATCHER {self.name}] Stopping with "
+                           f"{self._queue.qsize()} items pending.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, item: Any):
+        """
+        Enqueue an item. Waits only when the queue is full.
+        """
+        self.start()
+        await self._queue.put((time.monotonic(), item))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "workers": max(len(self._tasks) - 1, 0),
+            "queueDepth": self._queue.qsize() if self._queue else 0,
+            "inFlight": self._in_flight,
+            "delivered": self._delivered,
+            "failed": self._failed,
+            "batchesSent": self._batches_sent,
+            "lastLagSeconds": round(self._last_lag, 3),
+            "maxLagSeconds": round(self._max_lag, 3),
+        }
+
+    async def _collector(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(await asyncio.wait_for(
+                            self._queue.get(), timeout
+                        ))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+            await self._batches.put(batch)
+
+    async def _worker(self):
+        while True:
+            batch = await self._batches.get()
+            items = [item for _, item in batch]
+            self._in_flight += len(items)
+            try:
+                if await self.handler(items):
+                    self._delivered += len(items)
+                else:
+                    self._failed += len(items)
+            except Exception as e:
+                self._failed += len(items)
+                logger.error(f"[DISPATCHER {self.name}] Error delivering "
+                             f"batch of {len(items)} items: {e}")
+            finally:
+                self._in_flight -= len(items)
+                self._batches_sent += 1
+                self._last_lag = time.monotonic() - batch[0][0]
+                self._max_lag = max(self._max_lag, self._last_lag)
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,183 @@
+from collections import deque
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("apscheduler")
+
+# Fail fast on a destination after repeated errors or slow calls
+CIRCUIT_BREAKER_ENABLED = \
+    os.getenv("CIRCUIT_BREAKER_ENABLED", "false").lower() == 'true'
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+# Calls slower than this count as failures
+CIRCUIT_SLOW_CALL_SECONDS = \
+    float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "10"))
+# Adaptive timeout: p99 latency times the multiplier, within the bounds
+CIRCUIT_TIMEOUT_MULTIPLIER = \
+    float(os.getenv("CIRCUIT_TIMEOUT_MULTIPLIER", "3"))
+CIRCUIT_MIN_TIMEOUT_SECONDS = \
+    float(os.getenv("CIRCUIT_MIN_TIMEOUT_SECONDS", "2"))
+CIRCUIT_LATENCY_WINDOW = int(os.getenv("CIRCUIT_LATENCY_WINDOW", "200"))
+CIRCUIT_MIN_SAMPLES = 20
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Every breaker by name, for the admin endpoint
+circuit_breakers: Dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a destination whose circuit is open.
+    """
+
+
+def server_error(response) -> bool:
+    """
+    HTTP responses that count as failures. Client errors do not.
+    """
+    return response.status_code >= 500
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with an adaptive timeout for one destination.
+
+    After `failure_threshold` consecutive failures or slow calls the circuit
+    opens and calls fail with CircuitOpenError. After `reset_timeout`
+    seconds one probe is let through (half-open): success closes the
+    circuit, failure opens it again.
+
+    Calls get a timeout of `multiplier` times the observed p99 latency,
+    bounded by `min_timeout` and `max_timeout`. Probes use `max_timeout`
+    so the latency window can catch up when a destination gets slower.
+    """
+
+    def __init__(self, name: str, max_timeout: float,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS,
+                 slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+                 min_timeout: float = CIRCUIT_MIN_TIMEOUT_SECONDS,
+                 multiplier: float = CIRCUIT_TIMEOUT_MULTIPLIER,
+                 window: int = CIRCUIT_LATENCY_WINDOW):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.multiplier = multiplier
+        self._latencies = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+        self._calls = 0
+        self._failures = 0
+        self._rejected = 0
+        circuit_breakers[name] = self
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and \
+                time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def timeout(self) -> float:
+        if len(self._latencies) < CIRCUIT_MIN_SAMPLES:
+            return self.max_timeout
+        p99 = percentile(list(self._latencies), 0.99)
+        return max(self.min_timeout,
+                   min(self.max_timeout, p99 * self.multiplier))
+
+    async def call(self, request: Callable[[float], Awaitable[Any]],
+                   is_failure: Optional[Callable[[Any], bool]] = None):
+        """
+        Run `request(timeout)` through the breaker. Exceptions and results
+        for which `is_failure` is true count as failures; the result is
+        still returned.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return await request(self.max_timeout)
+
+        state = self.state
+        probe = state == HALF_OPEN
+        if state == OPEN or (probe and self._probe_in_flight):
+            self._rejected += 1
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+
+        self._calls += 1
+        self._probe_in_flight = probe or self._probe_in_flight
+        started = time.monotonic()
+        try:
+            result = await request(
+                self.max_timeout if probe else self.timeout()
+            )
+        except Exception as e:
+            self._on_failure(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            if probe:
+                self._probe_in_flight = False
+
+        elapsed = time.monotonic() - started
+        if is_failure is not None and is_failure(result):
+            self._on_failure("error response")
+        elif elapsed > self.slow_call_seconds:
+            self._latencies.append(elapsed)
+            self._on_failure(f"slow call ({elapsed:.1f} s)")
+        else:
+            self._latencies.append(elapsed)
+            self._on_success()
+        return result
+
+    def _on_success(self):
+        if self._state != CLOSED:
+            logger.info(f"[CIRCUIT {self.name}] Closed.")
+        self._state = CLOSED
+        self._consecutive_failures = 0
+
+    def _on_failure(self, reason: str):
+        self._failures += 1
+        self._consecutive_failures += 1
+        if self._state == OPEN or \
+                self._consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"[CIRCUIT {self.name}] Opened after "
+                               f"{self._consecutive_failures} failures. "
+                               f"Last: {reason}")
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        latencies = list(self._latencies)
+        p50 = percentile(latencies, 0.5)
+        p99 = percentile(latencies, 0.99)
+        state = self.state
+        return {
+            "name": self.name,
+            "enabled": CIRCUIT_BREAKER_ENABLED,
+            "state": state,
+            "consecutiveFailures": self._consecutive_failures,
+            "retryInSeconds": round(max(
+                self.reset_timeout - (time.monotonic() - self._opened_at), 0
+            ), 1) if state == OPEN else None,
+            "timeoutSeconds": round(self.timeout(), 3),
+            "p50LatencySeconds": round(p50, 3) if p50 is not None else None,
+            "p99LatencySeconds": round(p99, 3) if p99 is not None else None,
+            "calls": self._calls,
+            "failures": self._failures,
+            "rejected": self._rejected,
+        }
@@ -1,10 +1,20 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+from datetime import datetime, timezone
+import logging
 import os
 
+logger = logging.getLogger("apscheduler")
+
 MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     raise ValueError("MONGO_URI is not set in the environment variables")
 
+# "documents" stores positions as plain documents, "timeseries" stores them
+# in a native MongoDB time-series collection
+GPS_STORAGE_BACKEND = os.getenv("GPS_STORAGE_BACKEND", "documents").lower()
+GPS_RETENTION_SECONDS = 3 * 24 * 3600  # 3 days
+
 client = AsyncIOMotorClient(MONGO_URI)
 db = client["visionaline_db"]
 
@@ -16,31 +26,210 @@ alarms_collection = db["alarm_data"]
 gps_migtra_integration_collection = db["gps_migtra_integration"]
 gps_gauss_integration_collection = db["gps_gauss_integration"]
 alarms_gauss_integration_collection = db["alarms_gauss_integration"]
+alarm_pairs_collection = db["alarm_pairs"]
+gps_history_collection = db["gps_history"]
+scheduler_leases_collection = db["scheduler_leases"]
+gps_positions_ts_collection = db["gps_positions_ts"]
+dispatch_checkpoints_collection = db["dispatch_checkpoints"]
+gauss_sent_positions_collection = db["gauss_sent_positions"]
+dispatch_retries_collection = db["dispatch_retries"]
+dead_letters_collection = db["dispatch_dead_letters"]
 
 
-# Setup indexes
-async def setup_indexes():
-    await gps_payload_collection.create_index(
-        "receivedAt",
-        expireAfterSeconds=3 * 24 * 3600  # 3 days
-    )
-    await gps_collection.create_index(
-        "receivedAt",
-        expireAfterSeconds=3 * 24 * 3600  # 3 days
-    )
-    await alarms_payload_collection.create_index(
-        "receivedAt",
-        expireAfterSeconds=7 * 24 * 3600  # 7 days
-    )
-    await gps_migtra_integration_collection.create_index(
-        "sentAt",
-        expireAfterSeconds=3 * 24 * 3600  # 3 days
-    )
-    await gps_gauss_integration_collection.create_index(
-        "sentAt",
-        expireAfterSeconds=3 * 24 * 3600  # 3 days
+# Index catalogue: (collection, keys, options)
+INDEX_CATALOGUE = [
+    # Retention
+    (gps_payload_collection, [("receivedAt", 1)],
+     {"expireAfterSeconds": 3 * 24 * 3600}),  # 3 days
+    (gps_collection, [("receivedAt", 1)],
+     {"expireAfterSeconds": 3 * 24 * 3600}),  # 3 days
+    (gps_history_collection, [("receivedAt", 1)],
+     {"expireAfterSeconds": 3 * 24 * 3600}),  # 3 days
+    (alarms_payload_collection, [("receivedAt", 1)],
+     {"expireAfterSeconds": 7 * 24 * 3600}),  # 7 days
+    (gps_migtra_integration_collection, [("sentAt", 1)],
+     {"expireAfterSeconds": 3 * 24 * 3600}),  # 3 days
+    (gps_gauss_integration_collection, [("sentAt", 1)],
+     {"expireAfterSeconds": 3 * 24 * 3600}),  # 3 days
+    (alarms_gauss_integration_collection, [("sentAt", 1)],
+     {"expireAfterSeconds": 7 * 24 * 3600}),  # 7 days
+
+    # Dispatch: only unsent records are indexed
+    (gps_collection, [("sentToMigtra", 1), ("_id", 1)],
+     {"name": "unsent_migtra",
+      "partialFilterExpression": {"sentToMigtra": False}}),
+    (gps_collection, [("sentToGaussControl", 1), ("timeAt", 1)],
+     {"name": "unsent_gauss_time_at",
+      "partialFilterExpression": {"sentToGaussControl": False}}),
+
+    # Claimed dispatch batches
+    (gps_collection, [("migtraClaimToken", 1)],
+     {"name": "migtra_claim", "sparse": True}),
+    (gps_collection, [("gaussClaimToken", 1)],
+     {"name": "gauss_claim", "sparse": True}),
+
+    # Idempotent ingest: a retried position is rejected on insert
+    (gps_collection, [("id", 1)],
+     {"name": "unique_id", "unique": True}),
+    (gps_history_collection, [("id", 1)],
+     {"name": "unique_id", "unique": True}),
+
+    # History
+    (gps_collection, [("vehicleNumber", 1), ("timeAt", -1)],
+     {"name": "vehicle_time_at"}),
+    (gps_payload_collection, [("data.vehicleNumber", 1), ("timeAt", -1)],
+     {"name": "data_vehicle_time_at"}),
+    (gps_history_collection,
+     [("vehicleNumber", 1), ("timeAt", -1), ("_id", -1)],
+     {"name": "vehicle_time_at_id"}),
+    (alarms_payload_collection,
+     [("type", 1), ("timeAt", -1), ("_id", -1)],
+     {"name": "type_time_at_id"}),
+
+    # Retry queue: due batches first, dead letters by destination
+    (dispatch_retries_collection, [("nextAttemptAt", 1)],
+     {"name": "next_attempt_at"}),
+    (dead_letters_collection, [("destination", 1), ("deadAt", -1)],
+     {"name": "destination_dead_at"}),
+
+    # Alarm pairing: expired halves are found by last update
+    (alarm_pairs_collection, [("updatedAt", 1)],
+     {"name": "updated_at"}),
+]
+
+# Replaced indexes, dropped by `python -m app.jobs.migrate_time_fields`
+OBSOLETE_INDEXES = [
+    (gps_collection, "unsent_gauss_time"),
+    (gps_collection, "vehicle_time"),
+    (gps_payload_collection, "data_vehicle_time"),
+    (gps_history_collection, "vehicle_time_id"),
+    (alarms_payload_collection, "type_time"),
+    # Replaced by type_time_at_id, which also serves the _id tie-break
+    (alarms_payload_collection, "type_time_at"),
+    # Replaced by vehicle_timestamp_id, which also serves the _id tie-break
+    (gps_positions_ts_collection, "vehicle_timestamp"),
+]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Hot queries checked at startup: (name, collection, filter, sort)
+HOT_QUERIES = [
+    ("migtra_unsent", gps_collection,
+     {"sentToMigtra": False}, [("_id", 1)]),
+    ("gauss_unsent_window", gps_collection,
+     {"sentToGaussControl": False, "timeAt": {"$gte": EPOCH}}, None),
+    ("gps_history", gps_payload_collection,
+     {"type": "GPS", "data.vehicleNumber": "", "timeAt": {"$gt": EPOCH}},
+     [("timeAt", -1)]),
+    ("gps_history_page", gps_history_collection,
+     {"vehicleNumber": "", "timeAt": {"$gt": EPOCH}},
+     [("timeAt", -1), ("_id", -1)]),
+    ("alarms_history", alarms_payload_collection,
+     {"type": "ALARM", "timeAt": {"$gt": EPOCH}},
+     [("timeAt", -1), ("_id", -1)]),
+    # Exports filter by time only and walk the vehicle indexes backwards
+    ("gps_export", gps_collection,
+     {"timeAt": {"$gte": EPOCH, "$lt": EPOCH}},
+     [("vehicleNumber", -1), ("timeAt", 1)]),
+    ("gps_history_export", gps_history_collection,
+     {"timeAt": {"$gte": EPOCH, "$lt": EPOCH}},
+     [("vehicleNumber", -1), ("timeAt", 1)]),
+]
+
+if GPS_STORAGE_BACKEND == "timeseries":
+    INDEX_CATALOGUE += [
+        (gps_positions_ts_collection,
+         [("vehicle.vehicleNumber", 1), ("timestamp", -1), ("_id", -1)],
+         {"name": "vehicle_timestamp_id"}),
+        # Dispatch checkpoints advance over receivedAt
+        (gps_positions_ts_collection, [("receivedAt", 1), ("_id", 1)],
+         {"name": "received_at_id"}),
+    ]
+    HOT_QUERIES += [
+        ("gps_timeseries_history_page", gps_positions_ts_collection,
+         {"vehicle.vehicleNumber": "", "timestamp": {"$gt": EPOCH}},
+         [("timestamp", -1), ("_id", -1)]),
+    ]
+
+CHECK_QUERY_PLANS = \
+    os.getenv("CHECK_QUERY_PLANS", "true").lower() == 'true'
+
+
+async def setup_timeseries_collection():
+    """
+    Create the GPS time-series collection if it does not exist.
+    """
+    existing = await db.list_collection_names(
+        filter={"name": gps_positions_ts_collection.name}
     )
-    await alarms_gauss_integration_collection.create_index(
-        "sentAt",
-        expireAfterSeconds=7 * 24 * 3600  # 7 days
+    if existing:
+        return
+    await db.create_collection(
+        gps_positions_ts_collection.name,
+        timeseries={
+            "timeField": "timestamp",
+            "metaField": "vehicle",
+            "granularity": "seconds"
+        },
+        expireAfterSeconds=GPS_RETENTION_SECONDS
     )
+    logger.info("[DB] Time-series collection "
+                f"{gps_positions_ts_collection.name} created.")
+
+
+# Setup indexes
+async def setup_indexes():
+    if GPS_STORAGE_BACKEND == "timeseries":
+        await setup_timeseries_collection()
+    for collection, keys, options in INDEX_CATALOGUE:
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            # e.g. a unique index over existing duplicates. Keep booting,
+            # the migrations fix the data and build it again
+            logger.warning(f"[DB] Could not build index {keys} on "
+                           f"{collection.name}: {e}")
+    if CHECK_QUERY_PLANS:
+        await check_query_plans()
+
+
+def _plan_stages(plan) -> list:
+    """
+    Collect every stage name of an explain plan tree.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+async def check_query_plans():
+    """
+    Explain each hot query and warn when it falls back to a COLLSCAN or
+    to an in-memory sort.
+    """
+    for name, collection, query, sort in HOT_QUERIES:
+        try:
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = await cursor.explain()
+            winning_plan = explain.get("queryPlanner", {}).get("winningPlan")
+            stages = _plan_stages(winning_plan)
+            if "COLLSCAN" in stages:
+                logger.warning(f"[DB] Query '{name}' on {collection.name} "
+                               "uses a COLLSCAN. Check the index catalogue.")
+            elif sort and "SORT" in stages:
+                logger.warning(f"[DB] Query '{name}' on {collection.name} "
+                               "sorts in memory. Check the index catalogue.")
+            else:
+                logger.info(f"[DB] Query '{name}' on {collection.name} "
+                            "uses an index.")
+        except Exception as e:
+            logger.warning(f"[DB] Could not explain query '{name}': {e}")
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from pymongo.errors import BulkWriteError
+import logging
+from typing import Iterable, List
+
+logger = logging.getLogger("apscheduler")
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class RecentIdFilter:
+    """
+    LRU set of recently stored ids, used to drop retried positions before
+    they reach the database. Ids are only marked once they are stored, so a
+    failed write can be retried.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def take_new(self, records: List[dict], key: str = "id") -> List[dict]:
+        """
+        Keep records whose id was not seen, also dropping repeats inside
+        `records`. Records without id are kept.
+        """
+        if self.max_entries <= 0:
+            return records
+        new_records = []
+        batch_ids = set()
+        for record in records:
+            record_id = record.get(key)
+            if record_id is not None:
+                if record_id in self._ids:
+                    # Retried ids stay fresh while the retries go on
+                    self._ids.move_to_end(record_id)
+                    continue
+                if record_id in batch_ids:
+                    continue
+                batch_ids.add(record_id)
+            new_records.append(record)
+        return new_records
+
+    def mark_seen(self, ids: Iterable[str]):
+        if self.max_entries <= 0:
+            return
+        for record_id in ids:
+            if record_id is None:
+                continue
+            self._ids[record_id] = None
+            self._ids.move_to_end(record_id)
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._ids)
+
+
+async def insert_many_ignoring_duplicates(collection,
+                                          documents: List[dict]) -> int:
+    """
+    Unordered insert that skips documents rejected by a unique index.
+    Returns the number of documents inserted. Other write errors are raised.
+    """
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors) \
+                or e.details.get("writeConcernErrors"):
+            raise
+        logger.info(f"[DEDUP] Skipped {len(errors)} duplicate documents "
+                    f"in {collection.name}.")
+        return e.details.get("nInserted", len(documents) - len(errors))
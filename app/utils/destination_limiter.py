@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger("apscheduler")
+
+# Pause used when a 429 response has no usable Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+
+def retry_after_seconds(response) -> float:
+    """
+    Seconds requested by a Retry-After header, in seconds or HTTP-date form.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return DEFAULT_RETRY_AFTER_SECONDS
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class DestinationLimiter:
+    """
+    Bound the requests in flight to a destination and the rate at which
+    they start. A 429 response pauses every request to the destination for
+    the time given in its Retry-After header.
+    """
+
+    def __init__(self, name: str, concurrency: int = 4,
+                 rate_per_second: float = 0):
+        self.name = name
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+
+    async def _wait_turn(self):
+        while True:
+            now = time.monotonic()
+            start = max(now, self._next_start, self._paused_until)
+            if start <= now:
+                self._next_start = now + self._interval
+                return
+            await asyncio.sleep(start - now)
+
+    async def run(self, request: Callable[[], Awaitable]):
+        """
+        Run `request()` once a slot and a rate token are free.
+        Returns the response.
+        """
+        async with self._semaphore:
+            await self._wait_turn()
+            response = await request()
+            if getattr(response, "status_code", None) == 429:
+                pause = retry_after_seconds(response)
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + pause)
+                logger.warning(f"[LIMITER {self.name}] Rate limited. "
+                               f"Pausing for {pause:.1f} seconds.")
+            return response
@@ -0,0 +1,86 @@
+import httpx
+import logging
+import os
+from typing import Dict
+
+logger = logging.getLogger("apscheduler")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = \
+    int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == 'true'
+
+# Per destination timeouts (seconds)
+DESTINATION_TIMEOUTS = {
+    "gauss": float(os.getenv("GAUSS_HTTP_TIMEOUT", "30")),
+    "migtra": float(os.getenv("MIGTRA_HTTP_TIMEOUT", "30")),
+}
+
+# One long-lived client per destination
+http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client(destination: str) -> httpx.AsyncClient:
+    """
+    Build a pooled client with keep-alive for the given destination.
+    """
+    http2 = HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("[HTTP CLIENTS] HTTP2_ENABLED is set but the 'h2' "
+                       "package is not installed. Falling back to HTTP/1.1.")
+        http2 = False
+
+    timeout = DESTINATION_TIMEOUTS.get(destination, 30)
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 10)),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_http_client(destination: str) -> httpx.AsyncClient:
+    """
+    Get the shared client for a destination, creating it if needed.
+    """
+    client = http_clients.get(destination)
+    if client is None or client.is_closed:
+        client = _build_client(destination)
+        http_clients[destination] = client
+    return client
+
+
+def start_http_clients():
+    """
+    Open the clients for every known destination.
+    """
+    for destination in DESTINATION_TIMEOUTS:
+        get_http_client(destination)
+    logger.info("[HTTP CLIENTS] Clients ready for: "
+                f"{', '.join(http_clients)}")
+
+
+async def close_http_clients():
+    """
+    Close every shared client. Called on application shutdown.
+    """
+    for destination, client in list(http_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error("[HTTP CLIENTS] Error closing client "
+                         f"{destination}: {e}")
+    http_clients.clear()
+    logger.info("[HTTP CLIENTS] Clients closed.")
@@ -0,0 +1,120 @@
+from app.utils.dedup import insert_many_ignoring_duplicates
+from datetime import datetime, timezone
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+logger = logging.getLogger("apscheduler")
+
+
+class IngestBuffer:
+    """
+    Coalesce documents from many requests into large unordered insert_many
+    calls. A flush happens when `max_batch` documents are pending or
+    `flush_interval` seconds after the first pending document. Documents
+    rejected by a unique index are skipped.
+
+    The queue holds at most `capacity` pending requests. When it is full,
+    `put` waits, which pushes back on the webhook.
+
+    With `stamp_field`, that field is set to the flush time on every
+    document, so it never lags behind the time waited in the queue.
+    """
+
+    def __init__(self, name: str, collection, max_batch: int = 1000,
+                 flush_interval: float = 0.005, capacity: int = 1000,
+                 stamp_field: Optional[str] = None):
+        self.name = name
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.stamp_field = stamp_field
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=self.capacity)
+            self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush what is pending and stop the writer.
+        """
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def put(self, documents: List[dict], wait_for_flush: bool = True):
+        """
+        Enqueue documents. With `wait_for_flush` the call returns once they
+        are written and raises if the write failed.
+        """
+        if not documents:
+            return
+        self.start()
+        future = \
+            asyncio.get_running_loop().create_future() \
+            if wait_for_flush else None
+        await self._queue.put((documents, future))
+        if future is not None:
+            await future
+
+    async def _run(self):
+        while True:
+            documents, future = await self._queue.get()
+            batch = list(documents)
+            futures = [future]
+            taken = 1
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    documents, future = await asyncio.wait_for(
+                        self._queue.get(), timeout
+                    )
+                except asyncio.TimeoutError:
+                    break
+                batch.extend(documents)
+                futures.append(future)
+                taken += 1
+            await self._flush(batch, futures)
+            for _ in range(taken):
+                self._queue.task_done()
+
+    async def _flush(self, batch: List[dict], futures: list):
+        error = None
+        if self.stamp_field:
+            now = datetime.now(timezone.utc)
+            for document in batch:
+                document[self.stamp_field] = now
+        try:
+            inserted = await insert_many_ignoring_duplicates(
+                self.collection, batch
+            )
+            logger.info(f"[INGEST {self.name}] Flushed {inserted} "
+                        f"documents from {len(futures)} requests.")
+        except Exception as e:
+            error = e
+            logger.error(f"[INGEST {self.name}] Error flushing "
+                         f"{len(batch)} documents: {e}")
+        for future in futures:
+            if future is None or future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
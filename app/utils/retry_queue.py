@@ -0,0 +1,236 @@
+from app.utils.database import (
+    dispatch_retries_collection,
+    dead_letters_collection
+)
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+import asyncio
+import functools
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("apscheduler")
+
+# Failed batches are stored and retried with backoff instead of being
+# resent with the whole backlog on the next run
+DISPATCH_RETRY_ENABLED = \
+    os.getenv("DISPATCH_RETRY_ENABLED", "false").lower() == 'true'
+DISPATCH_RETRY_MAX_ATTEMPTS = \
+    int(os.getenv("DISPATCH_RETRY_MAX_ATTEMPTS", "8"))
+DISPATCH_RETRY_BASE_SECONDS = \
+    float(os.getenv("DISPATCH_RETRY_BASE_SECONDS", "5"))
+DISPATCH_RETRY_MAX_SECONDS = \
+    float(os.getenv("DISPATCH_RETRY_MAX_SECONDS", "900"))
+# Records per stored batch, keeps documents far below the BSON size limit
+DISPATCH_RETRY_CHUNK_SIZE = int(os.getenv("DISPATCH_RETRY_CHUNK_SIZE", "500"))
+DISPATCH_RETRY_POLL_SECONDS = \
+    float(os.getenv("DISPATCH_RETRY_POLL_SECONDS", "5"))
+# A claimed batch becomes due again if its worker dies
+DISPATCH_RETRY_LEASE_SECONDS = \
+    float(os.getenv("DISPATCH_RETRY_LEASE_SECONDS", "120"))
+
+
+def backoff_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter: between half and the full delay.
+    """
+    delay = min(DISPATCH_RETRY_MAX_SECONDS,
+                DISPATCH_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryQueue:
+    """
+    Persistent retry queue for failed dispatch batches.
+
+    Each batch is retried with exponential backoff and jitter. After
+    `max_attempts` failed attempts, the first send included, it is moved
+    to the dead-letter collection, from where it can be inspected and
+    replayed.
+    """
+
+    def __init__(self, collection, dead_letters, max_attempts: int,
+                 chunk_size: int, lease_seconds: float):
+        self.collection = collection
+        self.dead_letters = dead_letters
+        self.max_attempts = max_attempts
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self._senders: Dict[str, Callable[[List[dict]], Awaitable[bool]]] = {}
+
+    def wrap(self, destination: str,
+             send: Callable[[List[dict]], Awaitable[bool]]):
+        """
+        Register the sender of a destination. With retries enabled, returns
+        a sender that stores a failed batch in the queue and reports it as
+        handled, so the caller marks it as sent.
+        """
+        self._senders[destination] = send
+        if not DISPATCH_RETRY_ENABLED:
+            return send
+
+        @functools.wraps(send)
+        async def wrapper(records: List[dict]) -> bool:
+            if await send(records):
+                return True
+            try:
+                await self.enqueue(destination, records)
+            except Exception as e:
+                logger.error(f"[RETRY {destination}] Error queueing "
+                             f"{len(records)} records: {e}")
+                return False
+            return True
+        return wrapper
+
+    async def enqueue(self, destination: str, records: List[dict],
+                      error: Optional[str] = None):
+        now = datetime.now(timezone.utc)
+        documents = [
+            {
+                "destination": destination,
+                "records": records[start:start + self.chunk_size],
+                "count": len(records[start:start + self.chunk_size]),
+                "attempts": 1,
+                "lastError": error or "send failed",
+                "createdAt": now,
+                "nextAttemptAt": now + timedelta(seconds=backoff_delay(1)),
+            }
+            for start in range(0, len(records), self.chunk_size)
+        ]
+        if documents:
+            await self.collection.insert_many(documents)
+            logger.warning(f"[RETRY {destination}] Queued {len(records)} "
+                           f"records in {len(documents)} batches.")
+
+    async def claim_due(self) -> Optional[dict]:
+        """
+        Atomically claim one due batch by pushing its next attempt past
+        the lease.
+        """
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"nextAttemptAt": {"$lte": now}},
+            {"$set": {
+                "nextAttemptAt": now + timedelta(seconds=self.lease_seconds)
+            }},
+            sort=[("nextAttemptAt", 1)]
+        )
+
+    async def retry(self, batch: dict) -> bool:
+        destination = batch["destination"]
+        send = self._senders.get(destination)
+        error = None
+        try:
+            if send is None:
+                error = f"unknown destination {destination}"
+            elif await send(batch["records"]):
+                await self.collection.delete_one({"_id": batch["_id"]})
+                logger.info(f"[RETRY {destination}] Batch {batch['_id']} "
+                            f"delivered after {batch['attempts'] + 1} "
+                            "attempts.")
+                return True
+            else:
+                error = "send failed"
+        except Exception as e:
+            error = str(e)
+
+        attempts = batch["attempts"] + 1
+        now = datetime.now(timezone.utc)
+        if attempts >= self.max_attempts:
+            await self.dead_letters.insert_one({
+                **batch, "attempts": attempts, "lastError": error,
+                "deadAt": now
+            })
+            await self.collection.delete_one({"_id": batch["_id"]})
+            logger.error(f"[RETRY {destination}] Batch {batch['_id']} moved "
+                         f"to dead letters after {attempts} "
+                         f"attempts: {error}")
+            return False
+        await self.collection.update_one(
+            {"_id": batch["_id"]},
+            {"$set": {
+                "attempts": attempts,
+                "lastError": error,
+                "nextAttemptAt":
+                    now + timedelta(seconds=backoff_delay(attempts))
+            }}
+        )
+        return False
+
+    async def drain(self) -> int:
+        """
+        Retry due batches until none is due or one fails, so an outage is
+        probed with a single request per poll. Returns the batches sent.
+        """
+        sent = 0
+        while True:
+            batch = await self.claim_due()
+            if batch is None or not await self.retry(batch):
+                return sent
+            sent += 1
+
+    async def run(self, poll_seconds: float):
+        while True:
+            await asyncio.sleep(poll_seconds)
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"[RETRY] Error draining retry queue: {e}")
+
+    async def list_dead_letters(self, destination: Optional[str] = None,
+                                limit: int = 100,
+                                include_records: bool = False) -> List[dict]:
+        query = {"destination": destination} if destination else {}
+        projection = None if include_records else {"records": 0}
+        return await self.dead_letters.find(query, projection) \
+            .sort("deadAt", -1).limit(limit).to_list(None)
+
+    async def replay_dead_letters(self, query: dict) -> int:
+        """
+        Move matching dead letters back to the queue, due right away.
+        Returns the number of batches replayed.
+        """
+        replayed = 0
+        async for letter in self.dead_letters.find(query):
+            letter.pop("deadAt", None)
+            letter.update({
+                "attempts": 1,
+                "nextAttemptAt": datetime.now(timezone.utc),
+                "replayedAt": datetime.now(timezone.utc)
+            })
+            await self.collection.replace_one(
+                {"_id": letter["_id"]}, letter, upsert=True
+            )
+            await self.dead_letters.delete_one({"_id": letter["_id"]})
+            replayed += 1
+        if replayed:
+            logger.info(f"[RETRY] Replayed {replayed} dead-letter batches.")
+        return replayed
+
+    async def replay_dead_letter(self, letter_id: ObjectId) -> bool:
+        return await self.replay_dead_letters({"_id": letter_id}) > 0
+
+    async def stats(self) -> Dict[str, dict]:
+        stats = {
+            destination: {"pendingBatches": 0, "deadLetters": 0}
+            for destination in self._senders
+        }
+        for collection, field in ((self.collection, "pendingBatches"),
+                                  (self.dead_letters, "deadLetters")):
+            cursor = collection.aggregate([
+                {"$group": {"_id": "$destination", "count": {"$sum": 1}}}
+            ])
+            async for document in cursor:
+                stats.setdefault(
+                    document["_id"], {"pendingBatches": 0, "deadLetters": 0}
+                )[field] = document["count"]
+        return stats
+
+
+dispatch_retry_queue = RetryQueue(
+    dispatch_retries_collection, dead_letters_collection,
+    DISPATCH_RETRY_MAX_ATTEMPTS, DISPATCH_RETRY_CHUNK_SIZE,
+    DISPATCH_RETRY_LEASE_SECONDS
+)
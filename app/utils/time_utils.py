@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+GAUSS_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_iso_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an ISO 8601 time such as '2024-12-24T21:00:00Z' into a UTC
+    datetime. Raises ValueError when the value is not ISO 8601.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return as_utc(parsed)
+
+
+def parse_iso_time_or_none(value: Optional[str]) -> Optional[datetime]:
+    """
+    Same as parse_iso_time, but returns None for invalid values.
+    """
+    try:
+        return parse_iso_time(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Make a datetime timezone aware. MongoDB returns naive UTC datetimes.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def format_gauss_time(value: Union[datetime, str]) -> str:
+    """
+    Format a time as expected by Gauss ('%Y-%m-%d %H:%M:%S', UTC).
+    """
+    if not isinstance(value, datetime):
+        value = parse_iso_time(value)
+    return as_utc(value).strftime(GAUSS_TIME_FORMAT)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger("apscheduler")
+
+
+class TokenManager:
+    """
+    Cache an access token and refresh it shortly before it expires.
+
+    `fetcher` returns a tuple (token, expires_in_seconds). Only one fetch runs
+    at a time: concurrent callers await the same in-flight task.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            fetcher: Callable[[], Awaitable[Tuple[str, float]]],
+            refresh_margin: float = 60):
+        self.name = name
+        self._fetcher = fetcher
+        self._refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_token(self) -> str:
+        """
+        Return a valid token. Starts a background refresh when the current
+        token is about to expire and waits for a fetch only if it expired.
+        """
+        now = time.monotonic()
+        if self._token and now < self._expires_at:
+            if now >= self._refresh_at:
+                self._start_refresh()
+            return self._token
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self, token: Optional[str] = None):
+        """
+        Drop the cached token. When `token` is given, only drop it if it is
+        still the current one, so a burst of 401s triggers a single fetch.
+        """
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+            self._refresh_at = 0.0
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def _fetch(self) -> str:
+        token, expires_in = await self._fetcher()
+        expires_in = float(expires_in)
+        # Short-lived tokens refresh halfway, not on every call
+        margin = min(self._refresh_margin, expires_in / 2)
+        self._token = token
+        self._expires_at = time.monotonic() + expires_in
+        self._refresh_at = self._expires_at - margin
+        logger.info(f"[TOKEN {self.name}] Token refreshed. "
+                    f"Expires in {expires_in} seconds.")
+        return token
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"[TOKEN {self.name}] Error refreshing token: "
+                         f"{task.exception()}")
@@ -0,0 +1,123 @@
+from app.utils.time_utils import as_utc, parse_iso_time_or_none
+from datetime import datetime
+import math
+import numpy as np
+from typing import List, Optional, Union
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project_to_metres(lat: np.ndarray, lng: np.ndarray):
+    """
+    Equirectangular projection around the mean latitude of the track.
+    Accurate enough for the distances involved in a single route.
+    """
+    lat_rad = np.radians(lat)
+    cos_lat = np.cos(lat_rad.mean()) if lat_rad.size else 1.0
+    x = EARTH_RADIUS_M * np.radians(lng) * cos_lat
+    y = EARTH_RADIUS_M * lat_rad
+    return x, y
+
+
+def douglas_peucker_mask(lat: np.ndarray, lng: np.ndarray,
+                         tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification. Returns a boolean mask of the points to
+    keep. The distances of each segment are computed in one NumPy pass and
+    segments are processed with an explicit stack instead of recursion.
+    """
+    size = lat.size
+    keep = np.zeros(size, dtype=bool)
+    if size <= 2:
+        keep[:] = True
+        return keep
+
+    x, y = project_to_metres(lat, lng)
+    keep[0] = keep[-1] = True
+    stack = [(0, size - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px = x[start + 1:end]
+        py = y[start + 1:end]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px - x[start], py - y[start])
+        else:
+            # Distance to the segment, not to the infinite line
+            t = ((px - x[start]) * dx + (py - y[start]) * dy) / length_sq
+            t = np.clip(t, 0, 1)
+            distances = np.hypot(px - (x[start] + t * dx),
+                                 py - (y[start] + t * dy))
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def time_bucket_mask(times: np.ndarray, bucket_seconds: int) -> np.ndarray:
+    """
+    Keep the first point of each time bucket of `bucket_seconds`.
+    """
+    keep = np.zeros(times.size, dtype=bool)
+    if not times.size:
+        return keep
+    buckets = times // max(bucket_seconds, 1)
+    _, first_indexes = np.unique(buckets, return_index=True)
+    keep[first_indexes] = True
+    return keep
+
+
+def epoch_seconds(value: Union[datetime, str, None]) -> Optional[int]:
+    """
+    Convert a datetime or an ISO 8601 string to epoch seconds. Returns None
+    for missing or invalid times.
+    """
+    if isinstance(value, datetime):
+        parsed = as_utc(value)
+    else:
+        parsed = parse_iso_time_or_none(value)
+    if parsed is None:
+        return None
+    return math.floor(parsed.timestamp())
+
+
+def simplify_track(records: List[dict], mode: str,
+                   tolerance_m: float = 10, bucket_seconds: int = 60,
+                   time_field: str = "time") -> List[dict]:
+    """
+    Simplify a single vehicle track. `records` must be sorted by time,
+    in either direction. Points without coordinates are dropped.
+    `mode` is 'dp' (Douglas-Peucker, tolerance in metres) or 'bucket'
+    (one point per time bucket, points without a valid time are dropped).
+    """
+    records = [
+        record for record in records
+        if record.get("lat") is not None and record.get("lng") is not None
+    ]
+    if len(records) <= 2:
+        return records
+
+    if mode == "dp":
+        lat = np.fromiter((record["lat"] for record in records),
+                          dtype=float, count=len(records))
+        lng = np.fromiter((record["lng"] for record in records),
+                          dtype=float, count=len(records))
+        keep = douglas_peucker_mask(lat, lng, tolerance_m)
+    elif mode == "bucket":
+        timed = [(record, epoch_seconds(record.get(time_field)))
+                 for record in records]
+        records = [record for record, seconds in timed if seconds is not None]
+        times = np.array([seconds for _, seconds in timed
+                          if seconds is not None], dtype="int64")
+        keep = time_bucket_mask(times, bucket_seconds)
+    else:
+        raise ValueError("`simplify` debe ser 'dp' o 'bucket'")
+
+    return [record for record, kept in zip(records, keep) if kept]
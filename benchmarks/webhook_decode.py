@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for the GPS webhook decoding path.
+
+Compares the previous path (json.loads + GPSPayload(**dict) + payload.dict()
+echo) with validation straight from the raw bytes and a lean acknowledgement.
+
+Usage:
+    python -m benchmarks.webhook_decode [batch_size] [iterations]
+"""
+import json
+import sys
+import timeit
+
+from app.models.gps_data import GPSPayload
+
+
+def build_batch(size: int) -> bytes:
+    data = [
+        {
+            "id": f"pos-{i}",
+            "uniqueId": f"unique-{i % 200}",
+            "vehicleId": str(i % 200),
+            "angle": 90,
+            "lat": -33.45 + i * 1e-5,
+            "lng": -70.66 + i * 1e-5,
+            "speed": 54.2,
+            "time": "2024-12-24T21:00:00Z",
+            "numOfSatellites": 12,
+            "hdop": 0.9,
+            "signalStrength": 28,
+            "acc": 1,
+            "altitude": 520,
+            "vehicleNumber": f"RTBB{i % 200:02d} CAMION",
+            "fleetName": "Fleet",
+            "mileage": 12345.6,
+            "extendData": None,
+        }
+        for i in range(size)
+    ]
+    return json.dumps({
+        "tenantId": 1, "type": "GPS",
+        "time": "2024-12-24T21:00:00Z", "data": data
+    }).encode()
+
+
+def previous_path(raw_body: bytes) -> dict:
+    payload = GPSPayload(**json.loads(raw_body))
+    return {"status": "received", "data": payload.dict()}
+
+
+def fast_path(raw_body: bytes) -> dict:
+    payload = GPSPayload.model_validate_json(raw_body)
+    return {"status": "received", "payloadId": "-", "count": len(payload.data)}
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    raw_body = build_batch(batch_size)
+
+    previous = timeit.timeit(lambda: previous_path(raw_body),
+                             number=iterations) / iterations
+    fast = timeit.timeit(lambda: fast_path(raw_body),
+                         number=iterations) / iterations
+
+    print(f"Batch size: {batch_size} positions, {len(raw_body)} bytes")
+    print(f"Previous path: {previous * 1000:.3f} ms/batch")
+    print(f"Fast path + lean ack: {fast * 1000:.3f} ms/batch")
+    print(f"CPU saved: {(previous - fast) * 1000:.3f} ms/batch "
+          f"({(1 - fast / previous) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()